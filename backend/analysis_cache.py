@@ -0,0 +1,92 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+from disk_cache import DiskCache
+
+# Каталог, максимальный размер (байт, 0 - кэш отключён) и срок жизни записей (дней) кэша анализов
+ANALYSIS_CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR") or os.path.join(os.path.dirname(__file__), "pr_files", "analysis_cache")
+ANALYSIS_CACHE_MAX_BYTES = int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+ANALYSIS_CACHE_TTL_DAYS = float(os.getenv("ANALYSIS_CACHE_TTL_DAYS", "30"))
+
+
+class AnalysisCache(DiskCache):
+    """
+    Дисковый кэш ответов модели на анализ кода.
+
+    Ключ - хэш от названия модели, текста инструкции и отформатированного кода,
+    поэтому PR, попавший в несколько отчетов, анализируется моделью один раз, а смена
+    модели или инструкции автоматически делает старые записи недоступными.
+    Записи старше ttl удаляются при чтении, объём ограничен max_bytes (LRU по mtime).
+    """
+
+    NAME = "Кэш анализов"
+
+    def __init__(self, directory=None, max_bytes=None, ttl_days=None):
+        super().__init__(directory or ANALYSIS_CACHE_DIR,
+                         ANALYSIS_CACHE_MAX_BYTES if max_bytes is None else max_bytes)
+        self.ttl = (ANALYSIS_CACHE_TTL_DAYS if ttl_days is None else ttl_days) * 24 * 3600
+
+    @staticmethod
+    def key(model, instruction, code):
+        """
+        Возвращает ключ записи.
+
+        Args:
+            model (str): Название модели.
+            instruction (str): Текст инструкции.
+            code (str): Отформатированный код PR.
+
+        Returns:
+            str: SHA-256 от модели, инструкции и кода.
+        """
+        digest = hashlib.sha256()
+        for part in (model or "", instruction or "", code):
+            data = part.encode("utf-8")
+            # Длина каждой части исключает совпадение ключей при разном разбиении текста
+            digest.update(f"{len(data)}:".encode("ascii"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Возвращает сохранённый ответ модели или None.
+
+        Args:
+            key (str): Ключ из AnalysisCache.key.
+
+        Returns:
+            dict: Ответ API в формате send_request_to_api или None.
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            self._count(hit=False)
+            return None
+        if self.ttl and time.time() - entry.get("created", 0) > self.ttl:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self._count(hit=False)
+            return None
+        self._touch(path)
+        self._count(hit=True)
+        return entry["response"]
+
+    def put(self, key, response):
+        """
+        Сохраняет ответ модели.
+
+        Args:
+            key (str): Ключ из AnalysisCache.key.
+            response (dict): Ответ API.
+        """
+        if not self.enabled:
+            return
+        self._write_entry(self._path(key), {"created": time.time(), "response": response}, "анализ")
@@ -0,0 +1,151 @@
+# JSON Schema ответов модели. Передаются в vLLM (response_format) для генерации,
+# ограниченной схемой, и используются для проверки ответов
+
+CODE_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "complexity": {
+            "type": "object",
+            "properties": {
+                "level": {"type": "string", "enum": ["S", "M", "L"]},
+                "explanation": {"type": "string"}
+            },
+            "required": ["level", "explanation"]
+        },
+        "code_rating": {
+            "type": "object",
+            "properties": {
+                "score": {"type": "number", "minimum": 0, "maximum": 10},
+                "explanation": {"type": "string"}
+            },
+            "required": ["score", "explanation"]
+        },
+        "issues": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "type": {"type": "string", "enum": ["критическая", "предупреждение", "информация"]},
+                    "description": {"type": "string"}
+                },
+                "required": ["type", "description"]
+            }
+        },
+        "antipatterns": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}},
+                "required": ["name"]
+            }
+        },
+        "positive_aspects": {
+            "type": "array",
+            "items": {"type": "string"}
+        }
+    },
+    "required": ["complexity", "code_rating", "issues", "antipatterns", "positive_aspects"]
+}
+
+FINAL_REPORT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_score": {"type": "number", "minimum": 0, "maximum": 10},
+        "employee_rating": {
+            "type": "object",
+            "properties": {
+                "score": {"type": "number", "minimum": 0, "maximum": 10},
+                "description": {"type": "string"}
+            },
+            "required": ["score", "description"]
+        },
+        "recurring_issues": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"issue": {"type": "string"}},
+                "required": ["issue"]
+            }
+        },
+        "antipatterns": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"name": {"type": "string"}},
+                "required": ["name"]
+            }
+        }
+    },
+    "required": ["overall_score", "employee_rating", "recurring_issues", "antipatterns"]
+}
+
+
+TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool
+}
+
+
+def validate(instance, schema, path="$"):
+    """
+    Проверяет значение по JSON Schema (поддерживаются type, properties, required,
+    items, enum, minimum и maximum - всё, что используется в схемах выше).
+
+    Args:
+        instance: Проверяемое значение.
+        schema (dict): JSON Schema.
+        path (str, optional): Путь к значению для сообщений об ошибках.
+
+    Returns:
+        list: Сообщения об ошибках; пустой список, если значение соответствует схеме.
+    """
+    expected = schema.get("type")
+    if expected:
+        python_type = TYPES[expected]
+        # bool в Python - подкласс int, но в JSON это отдельный тип
+        if not isinstance(instance, python_type) or (isinstance(instance, bool) and expected != "boolean"):
+            return [f"{path}: ожидается {expected}"]
+
+    errors = []
+    if "enum" in schema and instance not in schema["enum"]:
+        errors.append(f"{path}: значение {instance!r} не из {schema['enum']}")
+    if "minimum" in schema and instance < schema["minimum"]:
+        errors.append(f"{path}: значение меньше {schema['minimum']}")
+    if "maximum" in schema and instance > schema["maximum"]:
+        errors.append(f"{path}: значение больше {schema['maximum']}")
+    if isinstance(instance, dict):
+        for name in schema.get("required", []):
+            if name not in instance:
+                errors.append(f"{path}: нет поля {name}")
+        for name, property_schema in schema.get("properties", {}).items():
+            if name in instance:
+                errors.extend(validate(instance[name], property_schema, f"{path}.{name}"))
+    if isinstance(instance, list) and "items" in schema:
+        for index, item in enumerate(instance):
+            errors.extend(validate(item, schema["items"], f"{path}[{index}]"))
+    return errors
+
+
+def packed_analysis_schema(pr_ids):
+    """
+    Схема ответа на пакетный запрос нескольких небольших PR: массив анализов
+    в формате CODE_ANALYSIS_SCHEMA, каждый с номером PR из запроса (pr_id).
+
+    Args:
+        pr_ids (list): Номера PR в запросе.
+
+    Returns:
+        dict: JSON Schema ответа.
+    """
+    item = dict(CODE_ANALYSIS_SCHEMA)
+    item["properties"] = dict(CODE_ANALYSIS_SCHEMA["properties"], pr_id={"type": "integer", "enum": list(pr_ids)})
+    item["required"] = ["pr_id"] + CODE_ANALYSIS_SCHEMA["required"]
+    return {
+        "type": "object",
+        "properties": {"analyses": {"type": "array", "items": item}},
+        "required": ["analyses"]
+    }
@@ -0,0 +1,234 @@
+import os
+import threading
+from diff_filter import split_diff_files
+from http_session import LLM_SESSION, default_timeout, get_session
+
+# Размер контекста модели (токенов); если сервер сообщает max_model_len, используется он
+LLM_CONTEXT_TOKENS = int(os.getenv("LLM_CONTEXT_TOKENS", "32768"))
+# Токены, резервируемые под ответ модели
+LLM_MAX_OUTPUT_TOKENS = int(os.getenv("LLM_MAX_OUTPUT_TOKENS", "2048"))
+# Максимальный размер части diff (токенов, 0 - весь доступный контекст). Небольшие части
+# анализируются параллельно и быстрее, чем один длинный запрос
+LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "8000"))
+# Среднее число символов кода на токен, пока оценка не откалибрована токенизатором модели
+DEFAULT_CHARS_PER_TOKEN = 3.0
+# Запас на разметку чата и обрамление кода в промпте (токенов)
+PROMPT_OVERHEAD_TOKENS = 64
+
+COMPLEXITY_LEVELS = ["S", "M", "L"]
+
+
+class TokenCounter:
+    """
+    Оценка числа токенов по длине текста, откалиброванная токенизатором модели.
+
+    При первой оценке текст один раз отправляется в эндпоинт /tokenize сервера vLLM,
+    по ответу вычисляется число символов на токен и размер контекста модели. Если
+    эндпоинт недоступен, используется DEFAULT_CHARS_PER_TOKEN и LLM_CONTEXT_TOKENS.
+    """
+
+    def __init__(self, tokenize_url=None, model=None):
+        self.tokenize_url = tokenize_url
+        self.model = model
+        self.chars_per_token = DEFAULT_CHARS_PER_TOKEN
+        self.context_tokens = LLM_CONTEXT_TOKENS
+        self._calibrated = False
+        self._lock = threading.Lock()
+
+    def calibrate(self, sample):
+        """
+        Калибрует оценку по образцу текста (выполняется один раз).
+
+        Args:
+            sample (str): Характерный текст, например код PR.
+        """
+        with self._lock:
+            if self._calibrated or not self.tokenize_url or len(sample) < 1000:
+                return
+            self._calibrated = True
+            try:
+                response = get_session(LLM_SESSION).post(
+                    self.tokenize_url, json={"model": self.model, "prompt": sample}, timeout=default_timeout(30)
+                )
+                response.raise_for_status()
+                payload = response.json()
+                if payload.get("count"):
+                    self.chars_per_token = len(sample) / payload["count"]
+                if payload.get("max_model_len"):
+                    self.context_tokens = payload["max_model_len"]
+                print(f"Токенизатор модели: {self.chars_per_token:.2f} символов на токен, "
+                      f"контекст {self.context_tokens} токенов")
+            except Exception as e:
+                print(f"Не удалось откалибровать оценку токенов, используем {self.chars_per_token} символа на токен: {e}")
+
+    def count(self, text):
+        """Возвращает оценку числа токенов в тексте."""
+        return int(len(text) / self.chars_per_token) + 1
+
+    def truncate(self, text, max_tokens):
+        """Обрезает текст до оценочного числа токенов."""
+        return text[:int(max_tokens * self.chars_per_token)]
+
+
+def _split_hunks(lines):
+    """Разбивает строки секции файла на заголовок и ханки (по строкам "@@")."""
+    header = []
+    hunks = []
+    for line in lines:
+        if line.startswith("@@"):
+            hunks.append([line])
+        elif hunks:
+            hunks[-1].append(line)
+        else:
+            header.append(line)
+    return header, hunks
+
+
+def split_diff_chunks(diff, max_tokens, counter):
+    """
+    Разбивает diff на части, каждая из которых укладывается в бюджет токенов.
+
+    Файлы объединяются в части целиком; файл, не помещающийся в бюджет, делится
+    по ханкам (каждая часть получает заголовок файла), а слишком большой ханк - по строкам.
+
+    Args:
+        diff (str): Текст diff.
+        max_tokens (int): Бюджет токенов на часть.
+        counter (TokenCounter): Оценка числа токенов.
+
+    Returns:
+        list: Части diff (str) в исходном порядке.
+    """
+    pieces = []
+    for section in split_diff_files(diff):
+        text = "".join(section["lines"])
+        if counter.count(text) <= max_tokens:
+            pieces.append(text)
+            continue
+        header, hunks = _split_hunks(section["lines"])
+        header_text = "".join(header)
+        for hunk in hunks or [section["lines"][len(header):]]:
+            hunk_text = header_text + "".join(hunk)
+            if counter.count(hunk_text) <= max_tokens:
+                pieces.append(hunk_text)
+                continue
+            current = header_text
+            for line in hunk:
+                if counter.count(current + line) > max_tokens and current != header_text:
+                    pieces.append(current)
+                    current = header_text
+                truncated = counter.truncate(line, max_tokens // 2)
+                if truncated != line:
+                    # Обрезанная строка сохраняет перевод строки, иначе склеится со следующей
+                    truncated += "\n"
+                current += truncated
+            pieces.append(current)
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and counter.count(current + piece) > max_tokens:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def pack_batches(texts, max_tokens, counter, min_size=1):
+    """
+    Группирует тексты по порядку в части, укладывающиеся в бюджет токенов.
+
+    Args:
+        texts (list): Тексты (например, JSON анализов PR).
+        max_tokens (int): Бюджет токенов на часть.
+        counter (TokenCounter): Оценка числа токенов.
+        min_size (int, optional): Минимальное число текстов в части (кроме последней),
+            даже если вместе они превышают бюджет. Значение 2 гарантирует, что
+            иерархическое объединение сокращает число частей на каждом уровне.
+
+    Returns:
+        list: Группы индексов текстов.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = counter.count(text)
+        if len(current) >= min_size and current_tokens + tokens > max_tokens:
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        if len(current) < min_size and batches:
+            batches[-1].extend(current)
+        else:
+            batches.append(current)
+    return batches
+
+
+def _unique(items, key):
+    seen = set()
+    result = []
+    for item in items:
+        marker = key(item)
+        if marker not in seen:
+            seen.add(marker)
+            result.append(item)
+    return result
+
+
+def merge_analyses(analyses, weights=None):
+    """
+    Объединяет анализы частей одного PR в один анализ той же структуры.
+
+    Сложность - максимальная из частей, оценка - среднее, взвешенное по размеру частей,
+    проблемы, антипаттерны и положительные стороны объединяются без повторов.
+
+    Args:
+        analyses (list): Анализы частей (результаты parse_analysis).
+        weights (list, optional): Веса частей, например число токенов.
+
+    Returns:
+        dict: Объединённый анализ или None, если анализов нет.
+    """
+    pairs = [(analysis, weight) for analysis, weight in zip(analyses, weights or [1] * len(analyses))
+             if isinstance(analysis, dict)]
+    if not pairs:
+        return None
+    if len(pairs) == 1:
+        return pairs[0][0]
+
+    merged = {}
+    levels = [(analysis.get("complexity") or {}) for analysis, _ in pairs]
+    known = [item.get("level") for item in levels if item.get("level") in COMPLEXITY_LEVELS]
+    if known:
+        merged["complexity"] = {
+            "level": max(known, key=COMPLEXITY_LEVELS.index),
+            "explanation": "\n".join(_unique([item["explanation"] for item in levels if item.get("explanation")], str))
+        }
+
+    scored = []
+    for analysis, weight in pairs:
+        try:
+            scored.append((float((analysis.get("code_rating") or {})["score"]), weight))
+        except (KeyError, TypeError, ValueError):
+            continue
+    if scored:
+        score = round(sum(score * weight for score, weight in scored) / sum(weight for _, weight in scored), 1)
+        merged["code_rating"] = {
+            "score": int(score) if score.is_integer() else score,
+            "explanation": "\n".join(_unique([(analysis.get("code_rating") or {}).get("explanation")
+                                              for analysis, _ in pairs
+                                              if (analysis.get("code_rating") or {}).get("explanation")], str))
+        }
+
+    merged["issues"] = _unique([issue for analysis, _ in pairs for issue in analysis.get("issues") or []],
+                               lambda issue: (issue.get("type"), issue.get("description")) if isinstance(issue, dict) else str(issue))
+    merged["antipatterns"] = _unique([item for analysis, _ in pairs for item in analysis.get("antipatterns") or []],
+                                     lambda item: item.get("name") if isinstance(item, dict) else str(item))
+    merged["positive_aspects"] = _unique([item for analysis, _ in pairs for item in analysis.get("positive_aspects") or []], str)
+    return merged
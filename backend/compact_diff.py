@@ -0,0 +1,183 @@
+import os
+import re
+from diff_filter import split_diff_files
+
+# Число строк контекста вокруг изменений
+DIFF_CONTEXT_LINES = int(os.getenv("DIFF_CONTEXT_LINES", "3"))
+# Сколько строк подряд идущего удалённого блока показывать; остальные заменяются счётчиком
+DIFF_MAX_DELETED_LINES = int(os.getenv("DIFF_MAX_DELETED_LINES", "3"))
+
+HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@")
+# Служебные строки заголовка файла в формате git diff
+HEADER_PREFIXES = (
+    "diff --git", "index ", "--- ", "+++ ", "new file mode", "deleted file mode", "old mode", "new mode",
+    "similarity index", "dissimilarity index", "rename from", "rename to", "copy from", "copy to",
+    "Binary files ", "GIT binary patch"
+)
+
+
+def _normalize_whitespace(text):
+    return " ".join(text.split())
+
+
+def _file_title(path, header):
+    """Короткий заголовок файла: путь и вид изменения (новый, удалён, переименован)."""
+    notes = []
+    for line in header:
+        if line.startswith("new file mode"):
+            notes.append("новый файл")
+        elif line.startswith("deleted file mode"):
+            notes.append("удалён")
+        elif line.startswith("rename from "):
+            notes.append(f"переименован из {line[len('rename from '):]}")
+        elif line.startswith("Binary files ") or line.startswith("GIT binary patch"):
+            notes.append("бинарный файл")
+    return f"### {path}" + (f" ({', '.join(notes)})" if notes else "")
+
+
+def _parse_hunks(lines):
+    """
+    Разбирает строки секции файла на заголовок и ханки.
+
+    Returns:
+        tuple: (строки заголовка, список ханков [(номер первой строки в новой версии или None, строки)]).
+    """
+    header = []
+    hunks = []
+    for line in lines:
+        match = HUNK_HEADER.match(line)
+        if match:
+            hunks.append((int(match.group(1)), []))
+        elif hunks:
+            hunks[-1][1].append(line)
+        elif line.startswith(HEADER_PREFIXES) and not (line.startswith("--- ") and any(item.startswith("+++ ") for item in header)):
+            # Строка "--- " после "+++ " - уже удалённая строка кода, а не заголовок
+            header.append(line.rstrip("\r\n"))
+        else:
+            # Часть большого ханка без строки "@@" (см. split_diff_chunks)
+            hunks.append((None, [line]))
+    return header, hunks
+
+
+def _collapse_run(removed, added, max_deleted):
+    """
+    Сворачивает блок изменений между строками контекста.
+
+    Пары удалённой и добавленной строк, отличающиеся только пробелами, и добавленные
+    или удалённые пустые строки становятся контекстом; длинные удалённые блоки
+    сокращаются до max_deleted строк и счётчика.
+
+    Returns:
+        list: Элементы (вид "+", "-" или " ", текст, номер строки в новой версии).
+    """
+    added_normalized = {}
+    for index, (text, _) in enumerate(added):
+        added_normalized.setdefault(_normalize_whitespace(text), []).append(index)
+    unchanged = set()
+    kept_removed = []
+    for text, number in removed:
+        normalized = _normalize_whitespace(text)
+        if not normalized:
+            continue
+        matches = added_normalized.get(normalized)
+        if matches:
+            unchanged.add(matches.pop(0))
+        else:
+            kept_removed.append((text, number))
+
+    entries = []
+    for text, number in kept_removed[:max_deleted]:
+        entries.append(("-", text, number))
+    if len(kept_removed) > max_deleted:
+        entries.append(("-", f"... удалено ещё строк: {len(kept_removed) - max_deleted}", kept_removed[max_deleted][1]))
+    for index, (text, number) in enumerate(added):
+        kind = " " if index in unchanged or not text.strip() else "+"
+        entries.append((kind, text, number))
+    return entries
+
+
+def _compact_hunk(start, lines, context_lines, max_deleted):
+    """Возвращает строки компактного представления ханка."""
+    entries = []
+    removed, added = [], []
+    number = start
+
+    def flush():
+        if removed or added:
+            entries.extend(_collapse_run(removed, added, max_deleted))
+            removed.clear()
+            added.clear()
+
+    for line in lines:
+        text = line.rstrip("\r\n")
+        if text.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+        kind, content = (text[0], text[1:].rstrip()) if text[:1] in ("+", "-", " ") else (" ", text.rstrip())
+        if kind == "-":
+            removed.append((content, number))
+            continue
+        if kind == "+":
+            added.append((content, number))
+        else:
+            flush()
+            entries.append((" ", content, number))
+        if number is not None:
+            number += 1
+    flush()
+
+    changed = [index for index, (kind, _, _) in enumerate(entries) if kind != " "]
+    if not changed:
+        return []
+    visible = set()
+    for index in changed:
+        visible.update(range(max(0, index - context_lines), min(len(entries), index + context_lines + 1)))
+
+    output = []
+    previous = None
+    for index in sorted(visible):
+        kind, content, line_number = entries[index]
+        if previous is None or index != previous + 1:
+            output.append(f"@@ {line_number}" if line_number is not None else "@@")
+        output.append(f"{kind}{content}" if kind != " " else f" {content}")
+        previous = index
+    return output
+
+
+def compact_diff(diff, context_lines=None, max_deleted_lines=None):
+    """
+    Переводит diff в компактное представление для модели.
+
+    Для каждого файла остаётся короткий заголовок "### путь" (с пометкой о новом,
+    удалённом или переименованном файле) и изменения с context_lines строками
+    контекста; "@@ N" отмечает номер строки в новой версии файла. Изменения только
+    в пробелах показываются как контекст, удалённые строки - знаком "-", а длинные
+    удалённые блоки - первыми строками и числом остальных. Содержимое удалённого
+    файла не передаётся.
+
+    Args:
+        diff (str): Текст diff.
+        context_lines (int, optional): Строк контекста, по умолчанию DIFF_CONTEXT_LINES.
+        max_deleted_lines (int, optional): Строк удалённого блока, по умолчанию DIFF_MAX_DELETED_LINES.
+
+    Returns:
+        str: Компактный diff.
+    """
+    context_lines = DIFF_CONTEXT_LINES if context_lines is None else context_lines
+    max_deleted = DIFF_MAX_DELETED_LINES if max_deleted_lines is None else max_deleted_lines
+    output = []
+    for section in split_diff_files(diff):
+        header, hunks = _parse_hunks(section["lines"])
+        title = _file_title(section["path"], header) if section["path"] else None
+        if section["path"] and any(line.startswith("deleted file mode") for line in header):
+            output.append(f"{title[:-1]}, строк: {section['deletions']})")
+            continue
+        body = []
+        for start, lines in hunks:
+            body.extend(_compact_hunk(start, lines, context_lines, max_deleted))
+        if title and hunks and not body:
+            output.append(f"{title} (только пробельные изменения)")
+        elif title:
+            output.append(title)
+        output.extend(body)
+    return "\n".join(output)
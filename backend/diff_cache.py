@@ -0,0 +1,100 @@
+import gzip
+import json
+import os
+from disk_cache import DiskCache
+
+# Каталог и максимальный размер кэша diff (байт, 0 - кэш отключён)
+DIFF_CACHE_DIR = os.getenv("DIFF_CACHE_DIR") or os.path.join(os.path.dirname(__file__), "pr_files", "diff_cache")
+DIFF_CACHE_MAX_BYTES = int(os.getenv("DIFF_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Ключ для закрытых PR, head SHA которых неизвестен (например, из результатов Search API)
+CLOSED_KEY = "closed"
+
+
+class DiffCache(DiskCache):
+    """
+    Сжатый дисковый кэш diff pull request'ов.
+
+    Записи адресуются хэшем от owner/repo, номера PR, head SHA и варианта загрузки
+    (правил пропуска файлов и лимита объёма), поэтому открытый PR загружается заново
+    только после изменения head SHA, а смена настроек фильтра не отдаёт diff,
+    отфильтрованный по старым правилам. Diff закрытого PR больше не
+    меняется и отдаётся из кэша по ссылке на последнюю запись без обращения к сети.
+    При превышении max_bytes удаляются давно не использованные записи (LRU по mtime).
+    """
+
+    NAME = "Кэш diff"
+
+    def __init__(self, directory=None, max_bytes=None):
+        super().__init__(directory or DIFF_CACHE_DIR, DIFF_CACHE_MAX_BYTES if max_bytes is None else max_bytes)
+
+    def _entry_path(self, owner, repo, pr_number, head_sha, variant):
+        return self._path(f"{owner}/{repo}#{pr_number}@{head_sha}/{variant}")
+
+    def _ref_path(self, owner, repo, pr_number):
+        return self._path(f"{owner}/{repo}#{pr_number}", ".ref")
+
+    def get(self, owner, repo, pr_number, variant, head_sha=None, closed=False):
+        """
+        Возвращает diff из кэша.
+
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            pr_number (int): Номер pull request'а.
+            variant (str): Вариант загрузки: хэш правил путей фильтра и лимит объёма.
+            head_sha (str, optional): Текущий head SHA PR.
+            closed (bool, optional): PR закрыт, и его diff больше не изменится.
+
+        Returns:
+            dict: Результат в формате GitHubParser.fetch_pr_diff или None.
+        """
+        if not self.enabled:
+            return None
+        keys = [head_sha] if head_sha else []
+        if closed:
+            try:
+                with open(self._ref_path(owner, repo, pr_number), "r", encoding="utf-8") as f:
+                    keys.append(f.read().strip())
+            except OSError:
+                pass
+
+        for key in keys:
+            path = self._entry_path(owner, repo, pr_number, key, variant)
+            try:
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._touch(path)
+            self._count(hit=True)
+            return entry
+        self._count(hit=False)
+        return None
+
+    def put(self, owner, repo, pr_number, variant, result, head_sha=None, closed=False):
+        """
+        Сохраняет diff в кэш. Открытый PR без head SHA не кэшируется.
+
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            pr_number (int): Номер pull request'а.
+            variant (str): Вариант загрузки: хэш правил путей фильтра и лимит объёма.
+            result (dict): Результат GitHubParser.fetch_pr_diff.
+            head_sha (str, optional): Head SHA PR.
+            closed (bool, optional): PR закрыт.
+        """
+        key = head_sha or (CLOSED_KEY if closed else None)
+        if not self.enabled or key is None:
+            return
+        path = self._entry_path(owner, repo, pr_number, key, variant)
+        if not self._write_entry(path, result, f"diff PR #{pr_number}") or not closed:
+            return
+        ref_path = self._ref_path(owner, repo, pr_number)
+        try:
+            os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+            with open(ref_path, "w", encoding="utf-8") as f:
+                f.write(key)
+        except OSError as e:
+            print(f"{self.NAME}: не удалось сохранить ссылку на diff PR #{pr_number}: {e}")
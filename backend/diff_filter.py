@@ -0,0 +1,228 @@
+import hashlib
+import json
+import os
+import re
+from fnmatch import fnmatch
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def _env_list(name, default=""):
+    """Читает список значений через запятую из переменной окружения (пустое значение - значение по умолчанию)."""
+    return [item.strip() for item in (os.getenv(name) or default).split(",") if item.strip()]
+
+
+# Файлы, которые никогда не отправляются на анализ: lock-файлы, сборки, зависимости,
+# минифицированные и сгенерированные файлы, бинарные ресурсы и служебная папка .github
+DEFAULT_EXCLUDE_PATTERNS = ",".join([
+    "package-lock.json", "yarn.lock", "pnpm-lock.yaml", "poetry.lock", "Pipfile.lock",
+    "Cargo.lock", "go.sum", "composer.lock", "Gemfile.lock",
+    "*.min.js", "*.min.css", "*.map", "*.svg", "*.png", "*.jpg", "*.jpeg", "*.gif", "*.ico",
+    "*.pdf", "*.woff", "*.woff2", "*.ttf", "*.eot", "*.zip", "*.jar",
+    "*_pb2.py", "*_pb2_grpc.py", "*.pb.go", "*.pb.cc", "*.pb.h", "*.generated.*", "*.g.dart",
+    ".github/*", "vendor/*", "node_modules/*", "dist/*", "build/*", "*/vendor/*", "*/node_modules/*"
+])
+
+# Glob-шаблоны исключаемых и включаемых файлов
+DIFF_EXCLUDE_PATTERNS = _env_list("DIFF_EXCLUDE_PATTERNS", DEFAULT_EXCLUDE_PATTERNS)
+DIFF_INCLUDE_PATTERNS = _env_list("DIFF_INCLUDE_PATTERNS")
+# Языки, которые отправляются на анализ (пусто - все)
+DIFF_LANGUAGES = [language.lower() for language in _env_list("DIFF_LANGUAGES")]
+# Максимальное число изменённых строк в одном файле
+DIFF_MAX_FILE_CHANGES = int(os.getenv("DIFF_MAX_FILE_CHANGES", "1500"))
+
+# Соответствие расширений файлов языкам
+LANGUAGE_EXTENSIONS = {
+    "python": [".py", ".pyi"],
+    "javascript": [".js", ".jsx", ".mjs", ".cjs"],
+    "typescript": [".ts", ".tsx"],
+    "vue": [".vue"],
+    "java": [".java"],
+    "kotlin": [".kt", ".kts"],
+    "go": [".go"],
+    "rust": [".rs"],
+    "c": [".c", ".h"],
+    "cpp": [".cpp", ".cc", ".cxx", ".hpp", ".hh"],
+    "csharp": [".cs"],
+    "php": [".php"],
+    "ruby": [".rb"],
+    "swift": [".swift"],
+    "scala": [".scala"],
+    "dart": [".dart"],
+    "sql": [".sql"],
+    "shell": [".sh", ".bash"],
+    "html": [".html", ".htm"],
+    "css": [".css", ".scss", ".sass", ".less"]
+}
+EXTENSION_LANGUAGES = {ext: language for language, exts in LANGUAGE_EXTENSIONS.items() for ext in exts}
+
+# Маркеры сгенерированного кода в первых строках файла
+GENERATED_MARKERS = re.compile(r"@generated|code generated .* do not edit|auto-?generated|do not edit", re.IGNORECASE)
+# Средняя длина добавленной строки, начиная с которой файл считается минифицированным
+MINIFIED_LINE_LENGTH = 300
+GENERATED_MARKER_LINES = 20
+
+DIFF_HEADER = re.compile(r"^diff --git a/(.+?) b/(.+)$")
+
+
+def split_diff_files(diff):
+    """
+    Разбивает diff на секции по файлам.
+
+    Args:
+        diff (str): Текст diff.
+
+    Returns:
+        list: Секции {"path", "lines", "additions", "deletions", "binary"} в порядке следования;
+              строки до первого заголовка файла попадают в секцию с path=None.
+    """
+    sections = []
+    current = None
+    # Строки "---"/"+++" являются заголовками только до первого "@@" секции,
+    # внутри ханков это удалённые и добавленные строки кода
+    in_hunks = False
+    for line in diff.splitlines(keepends=True):
+        match = DIFF_HEADER.match(line.rstrip("\n"))
+        if match:
+            current = {"path": match.group(2), "lines": [], "additions": 0, "deletions": 0, "binary": False}
+            sections.append(current)
+            in_hunks = False
+        elif current is None:
+            current = {"path": None, "lines": [], "additions": 0, "deletions": 0, "binary": False}
+            sections.append(current)
+        elif line.startswith("@@"):
+            in_hunks = True
+        elif line.startswith("+") and (in_hunks or not line.startswith("+++")):
+            current["additions"] += 1
+        elif line.startswith("-") and (in_hunks or not line.startswith("---")):
+            current["deletions"] += 1
+        elif line.startswith("Binary files ") or line.startswith("GIT binary patch"):
+            current["binary"] = True
+        current["lines"].append(line)
+    return sections
+
+
+def _added_lines(section):
+    """Возвращает добавленные строки секции split_diff_files (без "+" в начале)."""
+    added = []
+    in_hunks = False
+    for line in section["lines"]:
+        if line.startswith("@@"):
+            in_hunks = True
+        elif in_hunks and line.startswith("+"):
+            added.append(line[1:])
+    return added
+
+
+class DiffFileFilter:
+    """
+    Пофайловый фильтр diff перед анализом в LLM.
+
+    Отбрасывает файлы по glob-шаблонам, языку, размеру изменений, бинарные файлы
+    и сгенерированный код, чтобы в модель уходил только код, который имеет смысл ревьюить.
+    """
+
+    def __init__(self, exclude_patterns=None, include_patterns=None, languages=None, max_file_changes=None):
+        self.exclude_patterns = DIFF_EXCLUDE_PATTERNS if exclude_patterns is None else exclude_patterns
+        self.include_patterns = DIFF_INCLUDE_PATTERNS if include_patterns is None else include_patterns
+        self.languages = DIFF_LANGUAGES if languages is None else [language.lower() for language in languages]
+        self.max_file_changes = DIFF_MAX_FILE_CHANGES if max_file_changes is None else max_file_changes
+
+    @staticmethod
+    def _matches(path, patterns):
+        name = path.rsplit("/", 1)[-1]
+        return any(fnmatch(path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+    @staticmethod
+    def language_of(path):
+        """Определяет язык файла по расширению или возвращает None."""
+        return EXTENSION_LANGUAGES.get(os.path.splitext(path)[1].lower())
+
+    def path_exclusion_reason(self, path):
+        """
+        Проверяет файл по правилам, которым достаточно пути (glob-шаблоны и язык).
+
+        Args:
+            path (str): Путь к файлу в репозитории.
+
+        Returns:
+            str: Причина исключения или None, если файл проходит фильтр.
+        """
+        if self._matches(path, self.exclude_patterns):
+            return "шаблон исключения"
+        if self.include_patterns and not self._matches(path, self.include_patterns):
+            return "не входит в шаблоны включения"
+        if self.languages and self.language_of(path) not in self.languages:
+            return "язык не анализируется"
+        return None
+
+    def path_rules_key(self):
+        """Возвращает хэш правил путей: diff, загруженный с другими правилами, отличается набором пропущенных файлов."""
+        rules = [self.exclude_patterns, self.include_patterns, self.languages]
+        return hashlib.sha256(json.dumps(rules).encode("utf-8")).hexdigest()[:16]
+
+    def is_excluded_path(self, path):
+        """Возвращает True, если файл исключается уже по пути (используется при потоковой загрузке diff)."""
+        return self.path_exclusion_reason(path) is not None
+
+    def exclusion_reason(self, section, changes=None):
+        """
+        Проверяет секцию diff одного файла по всем правилам.
+
+        Args:
+            section (dict): Секция из split_diff_files.
+            changes (int, optional): Число изменённых строк из /pulls/{n}/files, если известно.
+
+        Returns:
+            str: Причина исключения или None.
+        """
+        path = section["path"]
+        reason = self.path_exclusion_reason(path)
+        if reason:
+            return reason
+        if section["binary"]:
+            return "бинарный файл"
+        if changes is None:
+            changes = section["additions"] + section["deletions"]
+        if self.max_file_changes and changes > self.max_file_changes:
+            return f"слишком большой ({changes} изменённых строк)"
+
+        added = _added_lines(section)
+        if any(GENERATED_MARKERS.search(line) for line in added[:GENERATED_MARKER_LINES]):
+            return "сгенерированный файл"
+        if added and sum(len(line) for line in added) / len(added) > MINIFIED_LINE_LENGTH:
+            return "минифицированный файл"
+        return None
+
+    def filter_diff(self, diff, files=None):
+        """
+        Оставляет в diff только файлы, пригодные для ревью.
+
+        Args:
+            diff (str): Текст diff.
+            files (list, optional): Список файлов PR из /pulls/{n}/files или GraphQL
+                (поля "filename", "additions", "deletions"/"changes").
+
+        Returns:
+            dict: {"diff": отфильтрованный diff, "excluded": [{"path", "reason"}]}.
+        """
+        changes_by_path = {}
+        for file_info in files or []:
+            changes = file_info.get("changes")
+            if changes is None:
+                changes = file_info.get("additions", 0) + file_info.get("deletions", 0)
+            changes_by_path[file_info["filename"]] = changes
+
+        kept = []
+        excluded = []
+        for section in split_diff_files(diff):
+            if section["path"] is None:
+                kept.extend(section["lines"])
+                continue
+            reason = self.exclusion_reason(section, changes_by_path.get(section["path"]))
+            if reason:
+                excluded.append({"path": section["path"], "reason": reason})
+            else:
+                kept.extend(section["lines"])
+        return {"diff": "".join(kept), "excluded": excluded}
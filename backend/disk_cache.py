@@ -0,0 +1,130 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+
+class DiskCache:
+    """
+    Базовый дисковый кэш с ограничением объёма.
+
+    Записи хранятся в файлах <каталог>/<2 символа хэша>/<sha256 ключа><суффикс>.
+    При превышении max_bytes удаляются давно не использованные записи (LRU по mtime).
+    Потокобезопасен.
+    """
+
+    # Суффикс файлов записей, которые учитываются в объёме кэша и удаляются при вытеснении
+    ENTRY_SUFFIX = ".json.gz"
+    NAME = "Кэш"
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def _path(self, key, suffix=None):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}{suffix or self.ENTRY_SUFFIX}")
+
+    @staticmethod
+    def _touch(path):
+        """Обновляет время использования записи для LRU."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _account(self, size):
+        """Учитывает новую запись размером size байт и при необходимости вытесняет старые."""
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(entry_size for _, entry_size, _ in self._entries())
+            else:
+                self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _write_entry(self, path, entry, description):
+        """
+        Атомарно сохраняет запись (сжатый JSON) и учитывает её в объёме кэша.
+
+        Запись пишется во временный файл потока и заменяет прежнюю через os.replace,
+        поэтому параллельные читатели не видят частично записанный файл.
+
+        Args:
+            path (str): Путь записи (из _path).
+            entry (dict): Содержимое записи.
+            description (str): Что сохраняется - для сообщения об ошибке.
+
+        Returns:
+            bool: True, если запись сохранена.
+        """
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"{self.NAME}: не удалось сохранить {description}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+        self._account(size)
+        return True
+
+    def _entries(self):
+        """Возвращает записи кэша как список (путь, размер, время использования)."""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(self.ENTRY_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        """Удаляет давно не использованные записи, пока размер кэша превышает max_bytes."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        self._total_bytes = total
+        if removed:
+            print(f"{self.NAME}: удалено записей: {removed}, размер: {total} байт")
+
+    def stats(self):
+        """Возвращает счётчики попаданий и промахов кэша."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "total_bytes": self._total_bytes}
@@ -0,0 +1,202 @@
+import os
+import random
+import re
+import zlib
+from collections import Counter, defaultdict
+
+# Сводить повторяющиеся находки анализов PR в кластеры перед итоговым отчетом
+FINDING_CLUSTERING = os.getenv("FINDING_CLUSTERING", "true").lower() in ("1", "true", "yes")
+# Минимальное сходство (коэффициент Жаккара по основам слов) формулировок одного кластера
+FINDING_CLUSTER_THRESHOLD = float(os.getenv("FINDING_CLUSTER_THRESHOLD", "0.5"))
+# Максимальное число кластеров каждого вида в сводке (самые частые)
+FINDING_CLUSTER_LIMIT = int(os.getenv("FINDING_CLUSTER_LIMIT", "40"))
+
+# MinHash: 64 хэш-функции, LSH - 16 полос по 4 строки (кандидаты от сходства ~0.5)
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+MERSENNE_PRIME = (1 << 61) - 1
+# Длина основы слова: грубая замена стемминга, сводит словоформы ("обработки", "обработка")
+STEM_LENGTH = 6
+# Максимальная длина примера формулировки в сводке (символов)
+EXAMPLE_LENGTH = 300
+EXAMPLES_PER_CLUSTER = 2
+
+STOP_WORDS = {
+    "и", "в", "во", "на", "не", "нет", "что", "как", "для", "при", "это", "или", "но", "по", "из", "от", "до",
+    "за", "с", "со", "к", "у", "о", "об", "а", "же", "ли", "бы", "так", "его", "их", "она", "оно", "они",
+    "то", "также", "может", "можно", "быть", "который", "которые", "которая", "где", "если", "чтобы",
+    "the", "a", "an", "of", "to", "in", "is", "are", "and", "or", "for", "on", "with", "not", "no", "be"
+}
+WORD_PATTERN = re.compile(r"[0-9a-zа-я_]+")
+
+_random = random.Random(20240601)
+_COEFFICIENTS = [(_random.randrange(1, MERSENNE_PRIME), _random.randrange(0, MERSENNE_PRIME))
+                 for _ in range(MINHASH_PERMUTATIONS)]
+
+
+def _normalize(text):
+    """Приводит формулировку к нижнему регистру и убирает пунктуацию и лишние пробелы."""
+    return " ".join(WORD_PATTERN.findall(str(text).lower().replace("ё", "е")))
+
+
+def _shingles(normalized):
+    """Множество основ значимых слов формулировки."""
+    return {word[:STEM_LENGTH] for word in normalized.split() if len(word) > 2 and word not in STOP_WORDS}
+
+
+def _minhash(shingles):
+    hashes = [zlib.crc32(shingle.encode("utf-8")) for shingle in shingles]
+    return [min((a * value + b) % MERSENNE_PRIME for value in hashes) for a, b in _COEFFICIENTS]
+
+
+def _jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 1.0
+
+
+def cluster_texts(texts, threshold=None):
+    """
+    Группирует близкие по смыслу формулировки.
+
+    Одинаковые после нормализации формулировки объединяются сразу. Для остальных
+    кандидаты в кластер находятся через MinHash и LSH (без сравнения всех пар),
+    а объединяются только пары с коэффициентом Жаккара не ниже порога.
+
+    Args:
+        texts (list): Формулировки.
+        threshold (float, optional): Порог сходства, по умолчанию FINDING_CLUSTER_THRESHOLD.
+
+    Returns:
+        list: Кластеры - списки индексов texts, от больших к меньшим.
+    """
+    threshold = FINDING_CLUSTER_THRESHOLD if threshold is None else threshold
+    groups = defaultdict(list)
+    for index, text in enumerate(texts):
+        groups[_normalize(text)].append(index)
+    keys = list(groups)
+    shingles = [_shingles(key) for key in keys]
+
+    parent = list(range(len(keys)))
+
+    def find(item):
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]
+            item = parent[item]
+        return item
+
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    buckets = defaultdict(list)
+    for item, item_shingles in enumerate(shingles):
+        if not item_shingles:
+            continue
+        signature = _minhash(item_shingles)
+        for band in range(LSH_BANDS):
+            bucket = buckets[(band, tuple(signature[band * rows:(band + 1) * rows]))]
+            for other in bucket:
+                if find(other) != find(item) and _jaccard(item_shingles, shingles[other]) >= threshold:
+                    parent[find(other)] = find(item)
+            bucket.append(item)
+
+    clusters = defaultdict(list)
+    for item, key in enumerate(keys):
+        clusters[find(item)].extend(groups[key])
+    return sorted((sorted(indexes) for indexes in clusters.values()), key=len, reverse=True)
+
+
+def _shorten(text):
+    text = str(text).strip()
+    return text if len(text) <= EXAMPLE_LENGTH else text[:EXAMPLE_LENGTH].rstrip() + "..."
+
+
+def _summarize(findings, limit):
+    """
+    Кластеризует находки и возвращает сводку по кластерам.
+
+    Args:
+        findings (list): Пары (номер анализа, {"text": формулировка, "type": тип или None}).
+        limit (int): Максимальное число кластеров в сводке.
+
+    Returns:
+        tuple: (список кластеров, число не вошедших в сводку кластеров).
+    """
+    clusters = cluster_texts([finding["text"] for _, finding in findings])
+    summary = []
+    for indexes in clusters:
+        members = [findings[index] for index in indexes]
+        variants = Counter(_normalize(finding["text"]) for _, finding in members)
+        # Представитель - самая частая формулировка, при равенстве - самая короткая
+        representative = min((finding["text"] for _, finding in members),
+                             key=lambda text: (-variants[_normalize(text)], len(text)))
+        examples = []
+        for normalized in variants:
+            if normalized != _normalize(representative) and len(examples) < EXAMPLES_PER_CLUSTER:
+                examples.append(_shorten(next(finding["text"] for _, finding in members
+                                              if _normalize(finding["text"]) == normalized)))
+        item = {"text": _shorten(representative)}
+        types = Counter(finding["type"] for _, finding in members if finding.get("type"))
+        if types:
+            item["type"] = types.most_common(1)[0][0]
+        item["count"] = len(members)
+        item["pr_count"] = len({source for source, _ in members})
+        if examples:
+            item["examples"] = examples
+        summary.append(item)
+    summary.sort(key=lambda item: (item["pr_count"], item["count"]), reverse=True)
+    return summary[:limit], max(0, len(summary) - limit)
+
+
+def cluster_findings(analyses, limit=None):
+    """
+    Сводит анализы PR в компактную статистику для итогового отчета.
+
+    Проблемы, антипаттерны и положительные стороны всех PR кластеризуются по сходству
+    формулировок; для каждого кластера сохраняются представительная формулировка,
+    число повторений, число PR и несколько примеров других формулировок. Оценки
+    и сложность сводятся в среднее и распределение.
+
+    Args:
+        analyses (list): Анализы PR (результаты parse_analysis с полем pr_info).
+        limit (int, optional): Максимальное число кластеров каждого вида, по умолчанию FINDING_CLUSTER_LIMIT.
+
+    Returns:
+        dict: Сводная статистика.
+    """
+    limit = FINDING_CLUSTER_LIMIT if limit is None else limit
+    issues, antipatterns, positive_aspects = [], [], []
+    scores = []
+    complexity = Counter()
+    for source, analysis in enumerate(analyses):
+        if not isinstance(analysis, dict):
+            continue
+        for issue in analysis.get("issues") or []:
+            if isinstance(issue, dict) and issue.get("description"):
+                issues.append((source, {"text": issue["description"], "type": issue.get("type")}))
+        for antipattern in analysis.get("antipatterns") or []:
+            name = antipattern.get("name") if isinstance(antipattern, dict) else antipattern
+            if name:
+                antipatterns.append((source, {"text": name}))
+        for aspect in analysis.get("positive_aspects") or []:
+            if aspect:
+                positive_aspects.append((source, {"text": aspect}))
+        try:
+            scores.append(float((analysis.get("code_rating") or {})["score"]))
+        except (KeyError, TypeError, ValueError):
+            pass
+        level = (analysis.get("complexity") or {}).get("level")
+        if level:
+            complexity[level] += 1
+
+    statistics = {
+        "pr_count": len(analyses),
+        "average_score": round(sum(scores) / len(scores), 1) if scores else None,
+        "score_range": [min(scores), max(scores)] if scores else None,
+        "complexity": dict(complexity)
+    }
+    omitted = {}
+    for name, findings in (("issues", issues), ("antipatterns", antipatterns), ("positive_aspects", positive_aspects)):
+        statistics[name], omitted_count = _summarize(findings, limit)
+        if omitted_count:
+            omitted[name] = omitted_count
+    if omitted:
+        # Число редких кластеров, не вошедших в сводку
+        statistics["omitted_clusters"] = omitted
+    return statistics
@@ -0,0 +1,176 @@
+import base64
+import os
+import re
+import subprocess
+import threading
+
+# Каталог локальных зеркал репозиториев
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR") or os.path.join(os.path.dirname(__file__), "pr_files", "mirrors")
+# Адрес источника зеркала; {owner} и {repo} подставляются. Для работы без сети можно
+# указать путь к локальным репозиториям, например /srv/repos/{owner}/{repo}
+GIT_MIRROR_URL = os.getenv("GIT_MIRROR_URL") or "https://github.com/{owner}/{repo}.git"
+# Таймаут клонирования и обновления зеркала (секунд)
+GIT_MIRROR_TIMEOUT = int(os.getenv("GIT_MIRROR_TIMEOUT", "600"))
+GIT_READ_CHUNK_SIZE = 64 * 1024
+
+# Обновляемые ссылки: ветки и головы pull request'ов
+MIRROR_REFSPECS = ["+refs/heads/*:refs/heads/*", "+refs/pull/*/head:refs/pull/*/head"]
+
+# Разделители полей и записей в выводе git log
+FIELD_SEPARATOR = "\x1f"
+RECORD_SEPARATOR = "\x1e"
+
+
+class GitMirror:
+    """
+    Локальное bare-зеркало репозитория для вычисления diff и списка коммитов PR без REST API.
+
+    Зеркало хранит ветки и refs/pull/*/head и обновляется один раз за время жизни объекта.
+    Источником может быть GitHub или обычный локальный репозиторий (тогда PR
+    определяются по head SHA и base SHA из метаданных PR).
+    """
+
+    def __init__(self, owner, repo, url=None, directory=None, token=None):
+        self.owner = owner
+        self.repo = repo
+        self.url = url or GIT_MIRROR_URL.format(owner=owner, repo=repo)
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{owner}__{repo}")
+        self.path = os.path.join(directory or GIT_MIRROR_DIR, f"{name}.git")
+        self.token = token
+        self._lock = threading.Lock()
+        self._fetched = False
+
+    def _env(self):
+        """Окружение git: без интерактивных запросов, токен передаётся заголовком, а не в командной строке."""
+        env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+        if self.token and self.url.startswith("https://"):
+            credentials = base64.b64encode(f"x-access-token:{self.token}".encode("utf-8")).decode("ascii")
+            env.update({
+                "GIT_CONFIG_COUNT": "1",
+                "GIT_CONFIG_KEY_0": "http.extraHeader",
+                "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credentials}"
+            })
+        return env
+
+    def _git(self, *args, timeout=None):
+        """
+        Выполняет команду git в каталоге зеркала.
+
+        Returns:
+            str: Стандартный вывод команды.
+
+        Raises:
+            Exception: Если команда завершилась с ошибкой.
+        """
+        result = subprocess.run(
+            ["git", "--git-dir", self.path, *args],
+            capture_output=True, env=self._env(), timeout=timeout
+        )
+        if result.returncode != 0:
+            raise Exception(f"git {args[0]}: {result.stderr.decode('utf-8', errors='replace').strip()}")
+        return result.stdout.decode("utf-8", errors="replace")
+
+    def sync(self):
+        """Создаёт зеркало при первом обращении и один раз обновляет его из источника."""
+        with self._lock:
+            if self._fetched:
+                return
+            if not os.path.isdir(self.path):
+                print(f"Создание зеркала {self.owner}/{self.repo} в {self.path}")
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                result = subprocess.run(
+                    ["git", "clone", "--bare", "--quiet", self.url, self.path],
+                    capture_output=True, env=self._env(), timeout=GIT_MIRROR_TIMEOUT
+                )
+                if result.returncode != 0:
+                    raise Exception(f"git clone: {result.stderr.decode('utf-8', errors='replace').strip()}")
+            self._git("fetch", "--quiet", "--prune", self.url, *MIRROR_REFSPECS, timeout=GIT_MIRROR_TIMEOUT)
+            self._fetched = True
+
+    def _has_object(self, rev):
+        try:
+            self._git("cat-file", "-e", f"{rev}^{{commit}}")
+            return True
+        except Exception:
+            return False
+
+    def resolve(self, pr):
+        """
+        Определяет коммиты головы и базы PR в зеркале.
+
+        Args:
+            pr (dict): Элемент списка PR в формате GitHub API.
+
+        Returns:
+            tuple: (base, head) - ревизии для git diff base...head.
+
+        Raises:
+            Exception: Если голова или база PR отсутствуют в зеркале или SHA базы не известен.
+        """
+        self.sync()
+        head_sha = (pr.get("head") or {}).get("sha")
+        pull_ref = f"refs/pull/{pr['number']}/head"
+        if head_sha and self._has_object(head_sha):
+            head = head_sha
+        elif self._has_object(pull_ref):
+            head = pull_ref
+        else:
+            raise Exception(f"PR #{pr['number']} отсутствует в зеркале {self.path}")
+
+        # Только SHA базы на момент PR: для принятого PR общая база с текущей вершиной
+        # ветки - сама голова PR, и diff от ветки оказался бы пустым
+        base = (pr.get("base") or {}).get("sha")
+        if not base:
+            raise Exception(f"Не известен SHA базы PR #{pr['number']}")
+        if not self._has_object(base):
+            raise Exception(f"База PR #{pr['number']} ({base}) отсутствует в зеркале {self.path}")
+        return base, head
+
+    def diff_chunks(self, base, head):
+        """
+        Потоково выводит diff в формате GitHub (от общей базы до головы PR).
+
+        Если чтение прекращается раньше, процесс git завершается.
+
+        Args:
+            base (str): Базовая ревизия.
+            head (str): Голова PR.
+
+        Yields:
+            bytes: Очередной фрагмент diff.
+        """
+        process = subprocess.Popen(
+            ["git", "--git-dir", self.path, "diff", "--no-color", "--no-ext-diff", "--find-renames", f"{base}...{head}"],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=self._env()
+        )
+        try:
+            for chunk in iter(lambda: process.stdout.read(GIT_READ_CHUNK_SIZE), b""):
+                yield chunk
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+
+    def commits(self, base, head):
+        """
+        Возвращает коммиты PR в хронологическом порядке.
+
+        Args:
+            base (str): Базовая ревизия.
+            head (str): Голова PR.
+
+        Returns:
+            list: Коммиты с полями "sha", "message", "author" (как в get_pr_commits).
+        """
+        output = self._git(
+            "log", "--reverse", f"--format=%H{FIELD_SEPARATOR}%an{FIELD_SEPARATOR}%B{RECORD_SEPARATOR}", f"{base}..{head}"
+        )
+        commits = []
+        for record in output.split(RECORD_SEPARATOR):
+            record = record.strip("\n")
+            if not record:
+                continue
+            sha, author, message = record.split(FIELD_SEPARATOR, 2)
+            commits.append({"sha": sha, "message": message.strip(), "author": author})
+        return commits
@@ -0,0 +1,293 @@
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Заголовки, которые не записываются в архив: тело хранится распакованным,
+# а лимиты при воспроизведении моделирует сам сервер
+SKIPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection", "date", "server")
+RATE_LIMIT_PREFIX = "x-ratelimit-"
+
+
+def request_key(method, path, body=None):
+    """
+    Ключ записи в архиве: метод, путь с параметрами и хэш тела запроса (для GraphQL).
+
+    Args:
+        method (str): HTTP-метод.
+        path (str): Путь с параметрами относительно базового адреса API.
+        body (bytes, optional): Тело запроса.
+
+    Returns:
+        str: Ключ записи.
+    """
+    key = f"{method.upper()} {path}"
+    if body:
+        key += f" {hashlib.sha256(body).hexdigest()}"
+    return key
+
+
+class FixtureRecorder:
+    """
+    Записывает ответы GitHub API в сжатый архив (gzip, по одной JSON-записи в строке).
+
+    Сохраняются статус, заголовки (включая Link для пагинации) и тело ответа.
+    Ссылки в заголовке Link сохраняются относительными, чтобы сервер воспроизведения
+    мог подставить собственный адрес. Потокобезопасен; запись дописывается в конец архива.
+    """
+
+    def __init__(self, path, api_url):
+        self.path = path
+        self.api_url = api_url.rstrip("/")
+        self._lock = threading.Lock()
+
+    def _relative(self, url):
+        return url[len(self.api_url):] if url.startswith(self.api_url) else url
+
+    def record(self, method, url, response):
+        """
+        Добавляет ответ в архив.
+
+        Тело потокового ответа не загружается заранее: оно записывается по мере чтения
+        фрагментов вызывающим кодом, а запись добавляется, только если ответ прочитан
+        полностью. Ответ, чтение которого прервано (например, diff, обрезанный по
+        размеру), не записывается, чтобы в архив не попало усечённое тело.
+
+        Args:
+            method (str): HTTP-метод.
+            url (str): Адрес запроса.
+            response (requests.Response): Ответ, который получил клиент.
+        """
+        if response._content_consumed:
+            self._write(self._entry(method, url, response, response.content))
+        else:
+            self._tee_stream(method, url, response)
+
+    def _tee_stream(self, method, url, response):
+        """Записывает тело потокового ответа, если вызывающий код прочитает его полностью."""
+        iter_content = response.iter_content
+
+        def recording_iter_content(chunk_size=1, decode_unicode=False):
+            chunks = []
+            for chunk in iter_content(chunk_size=chunk_size, decode_unicode=False):
+                chunks.append(chunk)
+                yield chunk
+            self._write(self._entry(method, url, response, b"".join(chunks)))
+
+        response.iter_content = recording_iter_content
+
+    def _entry(self, method, url, response, content):
+        body = response.request.body if response.request is not None else None
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        headers = {
+            name: value for name, value in response.headers.items()
+            if name.lower() not in SKIPPED_HEADERS and not name.lower().startswith(RATE_LIMIT_PREFIX)
+        }
+        if "Link" in headers:
+            headers["Link"] = headers["Link"].replace(self.api_url, "")
+        return {
+            "key": request_key(method, self._relative(url), body),
+            "status": response.status_code,
+            "headers": headers,
+            "resource": response.headers.get("X-RateLimit-Resource"),
+            "body": base64.b64encode(content).decode("ascii")
+        }
+
+    def _write(self, entry):
+        with self._lock:
+            with gzip.open(self.path, "at", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+def load_fixtures(path):
+    """
+    Загружает архив ответов.
+
+    Args:
+        path (str): Путь к архиву.
+
+    Returns:
+        dict: {ключ запроса: запись}; при повторах используется последняя запись.
+    """
+    fixtures = {}
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                fixtures[entry["key"]] = entry
+    return fixtures
+
+
+class ReplayServer:
+    """
+    Локальный HTTP-сервер, воспроизводящий записанные ответы GitHub API.
+
+    Поддерживает задержку ответа, моделирование лимитов (заголовки X-RateLimit-*
+    и ответ 403 при исчерпании бюджета), внедрение ошибок и условные запросы
+    по ETag. GitHubParser подключается к нему через api_url / GITHUB_API_URL.
+    """
+
+    def __init__(self, fixtures, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 rate_limit=None, rate_window=3600, error_rate=0.0, error_status=502, seed=None):
+        self.fixtures = load_fixtures(fixtures) if isinstance(fixtures, str) else fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.rate_window = rate_window
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._budgets = {}
+        self._thread = None
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Запускает сервер в фоновом потоке и возвращает его адрес."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def serve_forever(self):
+        """Обслуживает запросы в текущем потоке."""
+        self._server.serve_forever()
+
+    def stop(self):
+        """Останавливает сервер."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _rate_limit_headers(self, token, resource):
+        """Списывает запрос из бюджета токена и возвращает заголовки X-RateLimit-* или None при исчерпании."""
+        with self._lock:
+            now = time.time()
+            budget = self._budgets.get((token, resource))
+            if budget is None or budget["reset"] <= now:
+                budget = {"remaining": self.rate_limit, "reset": now + self.rate_window}
+                self._budgets[(token, resource)] = budget
+            exhausted = budget["remaining"] <= 0
+            if not exhausted:
+                budget["remaining"] -= 1
+            headers = {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(budget["remaining"]),
+                "X-RateLimit-Reset": str(int(budget["reset"])),
+                "X-RateLimit-Resource": resource
+            }
+        return None if exhausted else headers, headers
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, headers, body=b""):
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _reply(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else None
+                with server._lock:
+                    server.requests += 1
+                delay = server.latency + server._random.uniform(0, server.jitter)
+                if delay > 0:
+                    time.sleep(delay)
+
+                if server.error_rate and server._random.random() < server.error_rate:
+                    with server._lock:
+                        server.errors += 1
+                    self._send(server.error_status, {"Content-Type": "application/json"},
+                               json.dumps({"message": "Injected error"}).encode("utf-8"))
+                    return
+
+                entry = server.fixtures.get(request_key(method, self.path, body))
+                resource = (entry or {}).get("resource") or ("graphql" if urlparse(self.path).path.endswith("/graphql")
+                                                             else "search" if "/search/" in self.path else "core")
+                headers = {}
+                if server.rate_limit is not None:
+                    allowed, limit_headers = server._rate_limit_headers(self.headers.get("Authorization", ""), resource)
+                    headers.update(limit_headers)
+                    if allowed is None:
+                        self._send(403, dict(headers, **{"Content-Type": "application/json"}),
+                                   json.dumps({"message": "API rate limit exceeded"}).encode("utf-8"))
+                        return
+
+                if entry is None:
+                    self._send(404, dict(headers, **{"Content-Type": "application/json"}),
+                               json.dumps({"message": "Not Found (нет записи в архиве)"}).encode("utf-8"))
+                    return
+
+                headers.update(entry["headers"])
+                if "Link" in headers:
+                    # Относительные ссылки пагинации указывают на этот сервер
+                    headers["Link"] = re.sub(r"<(/[^>]*)>", lambda match: f"<{server.url}{match.group(1)}>", headers["Link"])
+                etag = headers.get("ETag")
+                if etag and self.headers.get("If-None-Match") == etag:
+                    self._send(304, {name: value for name, value in headers.items() if name.lower() != "content-type"})
+                    return
+                self._send(entry["status"], headers, base64.b64decode(entry["body"]))
+
+            def do_GET(self):
+                self._reply("GET")
+
+            def do_POST(self):
+                self._reply("POST")
+
+        return Handler
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Сервер воспроизведения записанных ответов GitHub API")
+    arg_parser.add_argument("fixtures", help="Архив ответов, записанный GitHubParser (GITHUB_RECORD_FILE)")
+    arg_parser.add_argument("--host", default="127.0.0.1")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--latency", type=float, default=0.0, help="Задержка ответа, сек")
+    arg_parser.add_argument("--jitter", type=float, default=0.0, help="Случайная добавка к задержке, сек")
+    arg_parser.add_argument("--rate-limit", type=int, default=None, help="Бюджет запросов на токен и ресурс")
+    arg_parser.add_argument("--rate-window", type=int, default=3600, help="Окно сброса лимита, сек")
+    arg_parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов с ошибкой")
+    arg_parser.add_argument("--error-status", type=int, default=502, help="Код ответа с ошибкой")
+    arg_parser.add_argument("--seed", type=int, default=None)
+    args = arg_parser.parse_args()
+
+    server = ReplayServer(
+        args.fixtures, host=args.host, port=args.port, latency=args.latency, jitter=args.jitter,
+        rate_limit=args.rate_limit, rate_window=args.rate_window, error_rate=args.error_rate,
+        error_status=args.error_status, seed=args.seed
+    )
+    print(f"Записей в архиве: {len(server.fixtures)}. Сервер: {server.url} (GITHUB_API_URL={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
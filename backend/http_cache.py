@@ -0,0 +1,146 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import requests
+from requests.structures import CaseInsensitiveDict
+from disk_cache import DiskCache
+
+# Каталог и максимальный размер HTTP-кэша (байт, 0 - условные запросы не используются)
+HTTP_CACHE_DIR = os.getenv("HTTP_CACHE_DIR") or os.path.join(os.path.dirname(__file__), "pr_files", "http_cache")
+HTTP_CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Заголовки, которые не сохраняются вместе с телом: тело хранится уже распакованным,
+# а бюджет лимитов берётся из фактического ответа 304
+SKIPPED_HEADERS = ("content-encoding", "content-length", "transfer-encoding", "connection")
+
+
+class ConditionalRequestCache(DiskCache):
+    """
+    Дисковый кэш ответов GitHub API для условных запросов.
+
+    Хранит ETag, Last-Modified, заголовки и тело успешных GET-ответов. Повторный
+    запрос отправляется с If-None-Match / If-Modified-Since; ответ 304 Not Modified
+    не расходует лимит GitHub API и заменяется сохранённым ответом.
+    Записи разделяются по URL, заголовку Accept и токену. Попаданием считается ответ 304.
+    """
+
+    NAME = "HTTP-кэш"
+
+    def __init__(self, directory=None, max_bytes=None):
+        super().__init__(directory or HTTP_CACHE_DIR, HTTP_CACHE_MAX_BYTES if max_bytes is None else max_bytes)
+
+    def _entry_path(self, url, headers):
+        # Токен входит в ключ только в виде хэша: ответы для разных токенов могут отличаться
+        authorization = hashlib.sha256(headers.get("Authorization", "").encode("utf-8")).hexdigest()
+        return self._path(f"{url}\n{headers.get('Accept', '')}\n{authorization}")
+
+    def conditional_headers(self, url, headers):
+        """
+        Возвращает заголовки запроса с условиями по сохранённому ответу.
+
+        Args:
+            url (str): Адрес запроса.
+            headers (dict): Исходные заголовки запроса.
+
+        Returns:
+            tuple: (заголовки запроса, сохранённая запись или None).
+        """
+        if not self.enabled:
+            return headers, None
+        path = self._entry_path(url, headers)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return headers, None
+
+        conditional = dict(headers)
+        if entry.get("etag"):
+            conditional["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            conditional["If-Modified-Since"] = entry["last_modified"]
+        return conditional, entry
+
+    def handle(self, url, headers, response, entry):
+        """
+        Обрабатывает ответ на условный запрос.
+
+        На 304 возвращает ответ, собранный из сохранённой записи. Успешный ответ
+        с ETag или Last-Modified сохраняется: сразу, если тело уже загружено,
+        или после полного чтения потокового ответа.
+
+        Args:
+            url (str): Адрес запроса.
+            headers (dict): Исходные заголовки запроса (без условий).
+            response (requests.Response): Ответ GitHub API.
+            entry (dict): Запись, по которой выполнялся условный запрос, или None.
+
+        Returns:
+            requests.Response: Ответ, который следует вернуть вызывающему коду.
+        """
+        if not self.enabled:
+            return response
+        path = self._entry_path(url, headers)
+        if response.status_code == 304 and entry is not None:
+            self._touch(path)
+            self._count(hit=True)
+            cached = self._build_response(url, entry, response)
+            response.close()
+            return cached
+
+        if response.status_code != 200:
+            return response
+        self._count(hit=False)
+        if not (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            return response
+
+        if response._content_consumed:
+            self._store(path, response, response.content)
+        else:
+            self._tee_stream(path, response)
+        return response
+
+    def _tee_stream(self, path, response):
+        """Сохраняет тело потокового ответа, если вызывающий код прочитает его полностью."""
+        iter_content = response.iter_content
+
+        def caching_iter_content(chunk_size=1, decode_unicode=False):
+            chunks = []
+            for chunk in iter_content(chunk_size=chunk_size, decode_unicode=False):
+                chunks.append(chunk)
+                yield chunk
+            self._store(path, response, b"".join(chunks))
+
+        response.iter_content = caching_iter_content
+
+    def _store(self, path, response, body):
+        """Атомарно сохраняет ответ в кэш."""
+        entry = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "headers": {
+                name: value for name, value in response.headers.items()
+                if name.lower() not in SKIPPED_HEADERS and not name.lower().startswith("x-ratelimit-")
+            },
+            "encoding": response.encoding,
+            "body": base64.b64encode(body).decode("ascii")
+        }
+        self._write_entry(path, entry, f"ответ {response.url}")
+
+    @staticmethod
+    def _build_response(url, entry, not_modified):
+        """Собирает ответ 200 из сохранённой записи и заголовков фактического ответа 304."""
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.headers.update({
+            name: value for name, value in not_modified.headers.items() if name.lower() not in SKIPPED_HEADERS
+        })
+        response.encoding = entry.get("encoding")
+        response._content = base64.b64decode(entry["body"])
+        response._content_consumed = True
+        response.request = not_modified.request
+        return response
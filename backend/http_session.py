@@ -0,0 +1,101 @@
+import os
+import threading
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+load_dotenv()
+
+# Число соединений keep-alive на один хост и число хостов, для которых хранятся пулы
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "16"))
+HTTP_POOL_HOSTS = int(os.getenv("HTTP_POOL_HOSTS", "4"))
+# Таймауты установки соединения и чтения ответа (секунд)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "60"))
+
+# Максимальное число одновременных запросов к модели: vLLM объединяет их
+# в общие батчи (continuous batching), поэтому GPU не простаивает между PR
+LLM_MAX_IN_FLIGHT = max(1, int(os.getenv("LLM_MAX_IN_FLIGHT", "16")))
+
+# Имена общих сессий
+GITHUB_SESSION = "github"
+LLM_SESSION = "llm"
+
+# Число соединений на хост для сессий, которым нужно больше HTTP_POOL_SIZE: пул задаётся
+# здесь, а не при вызове get_session, чтобы все вызывающие получали один и тот же адаптер
+# независимо от того, кто создал сессию первым
+SESSION_POOL_SIZES = {LLM_SESSION: max(HTTP_POOL_SIZE, LLM_MAX_IN_FLIGHT)}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def default_timeout(read_timeout=None):
+    """
+    Возвращает таймаут запроса в формате requests: (соединение, чтение).
+
+    Args:
+        read_timeout (float, optional): Таймаут чтения. По умолчанию HTTP_READ_TIMEOUT.
+
+    Returns:
+        tuple: (таймаут соединения, таймаут чтения).
+    """
+    return HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT if read_timeout is None else read_timeout
+
+
+def get_session(name):
+    """
+    Возвращает общую для процесса HTTP-сессию с пулом соединений keep-alive.
+
+    Повторные запросы к одному хосту используют уже установленные соединения
+    (и TLS-сессии) вместо нового подключения на каждый запрос.
+
+    Args:
+        name (str): Имя сессии (GITHUB_SESSION, LLM_SESSION). Число соединений на хост
+            берётся из SESSION_POOL_SIZES, по умолчанию HTTP_POOL_SIZE.
+
+    Returns:
+        requests.Session: Сессия с пулом соединений keep-alive.
+    """
+    with _sessions_lock:
+        if name not in _sessions:
+            session = requests.Session()
+            # Повторы выполняет вызывающий код, пул не должен их дублировать
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=SESSION_POOL_SIZES.get(name, HTTP_POOL_SIZE),
+                                  max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[name] = session
+        return _sessions[name]
+
+
+def pool_stats():
+    """
+    Возвращает статистику пулов соединений по сессиям и хостам.
+
+    Returns:
+        dict: {имя сессии: [{"host", "maxsize", "idle", "connections", "requests"}]}, где
+              connections - число открытых за всё время соединений, requests - число запросов,
+              idle - соединения, свободные в данный момент.
+    """
+    stats = {}
+    with _sessions_lock:
+        sessions = dict(_sessions)
+    for name, session in sessions.items():
+        adapter = session.get_adapter("https://")
+        pools = adapter.poolmanager.pools
+        hosts = []
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            hosts.append({
+                "host": f"{key.key_scheme}://{key.key_host}:{key.key_port}",
+                "maxsize": pool.pool.maxsize if pool.pool is not None else 0,
+                # Очередь пула заполнена заглушками None вместо ещё не открытых соединений
+                "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0,
+                "connections": pool.num_connections,
+                "requests": pool.num_requests
+            })
+        stats[name] = hosts
+    return stats
@@ -0,0 +1,159 @@
+import asyncio
+import hashlib
+import os
+from chunking import merge_analyses
+from diff_filter import split_diff_files
+
+# Повторно использовать анализ PR, все ханки которого уже встречались в других PR отчета
+HUNK_DEDUP = os.getenv("HUNK_DEDUP", "true").lower() in ("1", "true", "yes")
+
+
+def hunk_fingerprints(diff):
+    """
+    Вычисляет отпечатки ханков diff.
+
+    Отпечаток - хэш пути файла и изменённых строк ханка со знаком "+" или "-",
+    в которых пробелы нормализованы. Номера строк ("@@"), строки контекста и пустые
+    изменённые строки не учитываются, поэтому cherry-pick и бэкпорт в другую ветку
+    с тем же изменением дают те же отпечатки. Отмена изменения (revert) меняет знаки
+    строк и с исходным PR не совпадает.
+
+    Args:
+        diff (str): Текст diff.
+
+    Returns:
+        set: Отпечатки ханков (пустое множество, если изменённых строк нет).
+    """
+    fingerprints = set()
+    for section in split_diff_files(diff):
+        hunks = []
+        for line in section["lines"]:
+            if line.startswith("@@"):
+                hunks.append([])
+            elif hunks and line[:1] in ("+", "-"):
+                normalized = " ".join(line[1:].split())
+                if normalized:
+                    hunks[-1].append(line[0] + normalized)
+        for hunk in hunks:
+            if hunk:
+                digest = hashlib.sha256(f"{section['path']}\n".encode("utf-8"))
+                digest.update("\n".join(hunk).encode("utf-8"))
+                fingerprints.add(digest.hexdigest())
+    return fingerprints
+
+
+class HunkIndex:
+    """
+    Отпечатки ханков PR, проанализированных в рамках одного отчета.
+
+    PR, который первым (по порядку expect, то есть по дате создания) приносит ханк,
+    становится его источником и анализируется моделью. PR, все ханки которого уже
+    есть в индексе (бэкпорты, cherry-pick, повторные PR), не отправляется в модель:
+    он получает анализ PR-источников (объединённый, если источников несколько),
+    в том числе ещё выполняющийся. Diff загружаются параллельно, но регистрация
+    ханков идёт строго в порядке expect, поэтому результат не зависит от того, какой
+    diff загрузился раньше. Работает в одном event loop; каждый ожидаемый PR обязан
+    вызвать claim или release, источник - resolve.
+    """
+
+    def __init__(self):
+        self._owners = {}
+        self._results = {}
+        self._order = {}
+        self._sequence = []
+        self._finished = set()
+        self._next = 0
+        self._condition = None
+        self.reused = 0
+
+    def expect(self, keys):
+        """
+        Задаёт порядок регистрации PR.
+
+        Args:
+            keys (list): Идентификаторы PR от старых к новым.
+        """
+        for key in keys:
+            if key not in self._order:
+                self._order[key] = len(self._sequence)
+                self._sequence.append(key)
+
+    async def _wait_turn(self, key):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        position = self._order.get(key)
+        if position is None:
+            return
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._next >= position)
+
+    async def _finish(self, key):
+        if key not in self._order or key in self._finished:
+            return
+        self._finished.add(key)
+        while self._next < len(self._sequence) and self._sequence[self._next] in self._finished:
+            self._next += 1
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            self._condition.notify_all()
+
+    async def release(self, key):
+        """Отмечает, что PR не будет регистрировать ханки (ошибка загрузки, нет кода); повторный вызов ничего не делает."""
+        await self._finish(key)
+
+    async def claim(self, key, fingerprints):
+        """
+        Регистрирует ханки PR или находит более старые PR, которые их уже содержат.
+
+        Ожидает, пока зарегистрируются все PR, идущие раньше по порядку expect.
+
+        Args:
+            key (str): Идентификатор PR, например ссылка на него.
+            fingerprints (set): Отпечатки ханков PR (hunk_fingerprints).
+
+        Returns:
+            list: Идентификаторы PR-источников, если все ханки уже есть в индексе;
+                  иначе None - PR нужно проанализировать и передать результат в resolve.
+        """
+        await self._wait_turn(key)
+        try:
+            if fingerprints and all(fingerprint in self._owners for fingerprint in fingerprints):
+                return sorted({self._owners[fingerprint] for fingerprint in fingerprints})
+            self._results[key] = asyncio.get_running_loop().create_future()
+            for fingerprint in fingerprints:
+                self._owners.setdefault(fingerprint, key)
+            return None
+        finally:
+            await self._finish(key)
+
+    async def add(self, key, fingerprints, analysis):
+        """
+        Регистрирует PR с готовым анализом (например, из состояния синхронизации),
+        чтобы более новые PR с теми же ханками получали его анализ и в повторных запусках.
+        """
+        if await self.claim(key, fingerprints) is None:
+            self.resolve(key, analysis)
+
+    def resolve(self, key, analysis):
+        """Сохраняет анализ PR-источника (None, если анализ не получен)."""
+        future = self._results.get(key)
+        if future is not None and not future.done():
+            future.set_result(analysis)
+
+    async def reuse(self, sources):
+        """
+        Возвращает анализ PR-источников.
+
+        Args:
+            sources (list): Идентификаторы из claim.
+
+        Returns:
+            dict: Анализ (объединённый для нескольких источников) или None, если анализ
+                  какого-либо источника не получен - тогда PR анализируется сам.
+        """
+        analyses = [await self._results[source] for source in sources]
+        if any(analysis is None for analysis in analyses):
+            return None
+        self.reused += 1
+        return merge_analyses(analyses)
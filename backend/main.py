@@ -17,6 +17,7 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
 from reportlab.lib.units import mm, cm
 from datetime import datetime, timezone, timedelta
 import io
+import asyncio
 from typing import List, Optional
 import os
 import base64
@@ -25,6 +26,9 @@ import json
 import textwrap
 from pydantic import BaseModel
 from parser import GitHubParser
+from http_session import pool_stats
+from rate_limiter import shared_status
+from сode_analysis import ANALYSIS_CACHE, reload_instructions
 
 # Определяем московскую временную зону (UTC+3)
 MSK_TIMEZONE = timezone(timedelta(hours=3))
@@ -179,7 +183,7 @@ def pars_pr(token, owner, repo, state, start_date=None, end_date=None, author_em
         parser = GitHubParser(token)
 
         if not owner or not repo or not state: raise Exception("Missing required parameters: owner, repo, or state")
-        return parser.parse_prs(owner, repo, start_date, end_date, author_email)
+        return asyncio.run(parser.parse_prs(owner, repo, start_date, end_date, author_email))
         
     except Exception as e:
         print('Error:', str(e))
@@ -248,7 +252,7 @@ async def generate_report_async(process_id: str, report_req: ReportRequest):
         # Обновляем статус
         report_status[process_id]["message"] = "Анализ PR начат"
         
-        analysis_results = parser.analyze_all_prs(
+        analysis_results = await parser.analyze_all_prs(
             report_req.repoLinks,
             start_date=report_req.startDate,
             end_date=report_req.endDate,
@@ -576,7 +580,10 @@ async def generate_report_async(process_id: str, report_req: ReportRequest):
                     
                     data.append(["Репозиторий:", pr['pr_info']['repository']])
                     data.append(["Ссылка:", pr['pr_info']['link']])
-                    
+                    # PR повторяет изменения других PR (бэкпорт, cherry-pick) - анализ взят у них
+                    if pr['pr_info'].get('analysis_reused_from'):
+                        data.append(["Анализ из:", "\n".join(pr['pr_info']['analysis_reused_from'])])
+
                     # Создание таблицы
                     t = Table(data, colWidths=[100, 330])
                     t.setStyle(TableStyle([
@@ -775,6 +782,46 @@ async def test_db():
     except Exception as e:
         return {"db_status": "Error", "error": str(e)}
 
+@app.get("/stats/http-pool")
+async def get_http_pool_stats():
+    """
+    Статистика пулов HTTP-соединений к GitHub API и модели.
+    
+    Returns:
+        dict: Размер пула, свободные соединения и счётчики соединений и запросов по хостам.
+    """
+    return pool_stats()
+
+@app.get("/stats/github-rate-limit")
+async def get_github_rate_limit_stats():
+    """
+    Состояние лимитов GitHub API по токенам.
+    
+    Returns:
+        dict: Для каждого токена - лимит, остаток, время сброса и число выполняющихся запросов по ресурсам.
+    """
+    return shared_status()
+
+@app.get("/stats/analysis-cache")
+async def get_analysis_cache_stats():
+    """
+    Статистика кэша анализов кода.
+    
+    Returns:
+        dict: Число попаданий и промахов и текущий объём кэша в байтах.
+    """
+    return ANALYSIS_CACHE.stats()
+
+@app.post("/instructions/reload")
+async def reload_instruction_files():
+    """
+    Повторное чтение файлов инструкций модели без перезапуска сервера.
+    
+    Returns:
+        dict: Удалось ли прочитать инструкцию анализа кода.
+    """
+    return {"reloaded": reload_instructions()}
+
 @app.get("/tables")
 async def get_tables():
     """
@@ -1,21 +1,42 @@
 import requests
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from datetime import datetime
 import json
-import sys
-from сode_analysis import send_request_to_api, parse_analysis
+import threading
+from сode_analysis import (LLM_MAX_IN_FLIGHT, TOKEN_COUNTER, code_token_budget, send_request_to_api_async,
+                           parse_analysis, load_instruction, analysis_version)
+from compact_diff import compact_diff
+from chunking import merge_analyses, pack_batches, split_diff_chunks
+from analysis_schema import CODE_ANALYSIS_SCHEMA, FINAL_REPORT_SCHEMA
+from finding_clusters import FINDING_CLUSTERING, cluster_findings
+from pr_packing import LLM_PACK_SMALL_PRS, PrPacker
+from hunk_index import HUNK_DEDUP, HunkIndex, hunk_fingerprints
+from sync_state import RepoSyncState
+from diff_filter import DiffFileFilter
+from diff_cache import DiffCache
+from http_cache import ConditionalRequestCache
+from http_session import GITHUB_SESSION, default_timeout, get_session
+from git_mirror import GitMirror
+from github_replay import FixtureRecorder
+from rate_limiter import CORE_RESOURCE, SEARCH_RESOURCE, GRAPHQL_RESOURCE, is_rate_limited
+from token_pool import TokenPool, parse_tokens
 import os
 import re
 import time
+import random
+from urllib.parse import quote, urlparse, parse_qs
 from dotenv import load_dotenv
 
 try:
-    from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
+    from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception
 except ImportError:
     print("Warning: tenacity library not installed. Falling back to basic retry logic.")
     retry = lambda *args, **kwargs: lambda x: x  # Заглушка для декоратора
     stop_after_attempt = lambda x: None
     wait_fixed = lambda x: None
-    retry_if_exception_type = lambda x: None
+    retry_if_exception = lambda x: None
 
 # Загружаем переменные окружения из файла .env
 load_dotenv()
@@ -23,32 +44,543 @@ load_dotenv()
 # Настройка повторных попыток для запросов API
 MAX_ANALYSIS_RETRIES = 3
 RETRY_INTERVAL = 5  # секунд
+FINAL_REPORT_INSTRUCTION_FILE = "promts/final_report_instruction.txt"
+MERGE_REPORT_INSTRUCTION_FILE = "promts/merge_report_instruction.txt"
+
+# Базовый адрес GitHub API (например, адрес сервера воспроизведения github_replay.py)
+GITHUB_API_URL = os.getenv("GITHUB_API_URL") or "https://api.github.com"
+# Архив для записи ответов GitHub API (пусто - запись отключена)
+GITHUB_RECORD_FILE = os.getenv("GITHUB_RECORD_FILE")
+
+# Максимальное число одновременных запросов к GitHub API
+GITHUB_MAX_CONCURRENCY = int(os.getenv("GITHUB_MAX_CONCURRENCY", "8"))
+# Сколько раз повторять запрос, отклонённый из-за лимита GitHub API
+RATE_LIMIT_RETRIES = 3
+
+# Повторные попытки загрузки одной страницы списка с экспоненциальной задержкой и случайным разбросом
+PAGE_RETRIES = 5
+PAGE_BACKOFF_BASE = 1.0  # секунд
+PAGE_BACKOFF_MAX = 30.0  # секунд
+
+# Максимальный объём diff одного PR (байт); остаток diff не загружается
+GITHUB_MAX_DIFF_BYTES = int(os.getenv("GITHUB_MAX_DIFF_BYTES", "262144"))
+DIFF_STREAM_CHUNK_SIZE = 64 * 1024
+# Брать размеры изменённых файлов из /pulls/{n}/files (дополнительный запрос на PR) вместо заголовков diff
+DIFF_FILTER_USE_FILES_API = os.getenv("DIFF_FILTER_USE_FILES_API", "false").lower() in ("1", "true", "yes")
+
+# Способ загрузки метаданных PR: "rest" или "graphql"
+GITHUB_FETCH_BACKEND = os.getenv("GITHUB_FETCH_BACKEND", "rest")
+# Инкрементальная синхронизация: повторные отчеты запрашивают у GitHub только новые и изменённые PR
+GITHUB_INCREMENTAL_SYNC = os.getenv("GITHUB_INCREMENTAL_SYNC", "true").lower() in ("1", "true", "yes")
+# Источник diff и коммитов PR: "api" (REST API) или "git" (локальное зеркало репозитория)
+GITHUB_DIFF_BACKEND = os.getenv("GITHUB_DIFF_BACKEND", "api")
+# Количество PR в одном GraphQL-запросе (не более 100); крупные пакеты рискуют упереться в таймаут GitHub
+GRAPHQL_PAGE_SIZE = min(int(os.getenv("GITHUB_GRAPHQL_PAGE_SIZE", "50")), 100)
+
+# Поля PR, запрашиваемые через GraphQL: метаданные, даты статусов, коммиты и изменённые файлы
+GRAPHQL_PR_FIELDS = """
+fragment PullRequestFields on PullRequest {
+  number
+  url
+  createdAt
+  updatedAt
+  closedAt
+  mergedAt
+  state
+  author { login }
+  headRefOid
+  baseRefName
+  baseRefOid
+  commits(first: 100) {
+    pageInfo { hasNextPage endCursor }
+    nodes { commit { oid message author { name } } }
+  }
+  files(first: 100) {
+    pageInfo { hasNextPage endCursor }
+    nodes { path additions deletions changeType }
+  }
+}
+"""
+
+GRAPHQL_SEARCH_QUERY = GRAPHQL_PR_FIELDS + """
+query($query: String!, $first: Int!, $after: String) {
+  search(query: $query, type: ISSUE, first: $first, after: $after) {
+    pageInfo { hasNextPage endCursor }
+    nodes { ...PullRequestFields }
+  }
+}
+"""
+
+GRAPHQL_REPOSITORY_QUERY = GRAPHQL_PR_FIELDS + """
+query($owner: String!, $repo: String!, $states: [PullRequestState!], $first: Int!, $after: String, $orderBy: IssueOrderField!) {
+  repository(owner: $owner, name: $repo) {
+    pullRequests(states: $states, first: $first, after: $after, orderBy: {field: $orderBy, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes { ...PullRequestFields }
+    }
+  }
+}
+"""
+
+# Дозагрузка коммитов и файлов PR, которые не поместились в первую страницу по 100 элементов
+GRAPHQL_PR_COMMITS_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!, $after: String) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      commits(first: 100, after: $after) {
+        pageInfo { hasNextPage endCursor }
+        nodes { commit { oid message author { name } } }
+      }
+    }
+  }
+}
+"""
+
+GRAPHQL_PR_FILES_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!, $after: String) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      files(first: 100, after: $after) {
+        pageInfo { hasNextPage endCursor }
+        nodes { path additions deletions changeType }
+      }
+    }
+  }
+}
+"""
+
+# Соответствие состояний PR в REST API и GraphQL
+GRAPHQL_STATES = {
+    "open": ["OPEN"],
+    "closed": ["CLOSED", "MERGED"],
+    "all": ["OPEN", "CLOSED", "MERGED"]
+}
+
+
+def _is_transient_error(exception):
+    """
+    Проверяет, стоит ли повторять запрос после ошибки.
+    Превышение лимита сюда не относится: его ожиданием управляет RateLimitScheduler.
+    """
+    if isinstance(exception, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(exception, requests.exceptions.HTTPError) and exception.response is not None:
+        return exception.response.status_code >= 500
+    return False
+
+
+def _backoff_delay(attempt):
+    """Задержка перед повторной попыткой: экспоненциальный рост со случайным разбросом (full jitter)."""
+    return random.uniform(0, min(PAGE_BACKOFF_MAX, PAGE_BACKOFF_BASE * 2 ** attempt))
+
+
+class PaginationCursor:
+    """
+    Курсор постраничной загрузки списка GitHub API.
+    
+    Хранит уже загруженные страницы, поэтому временная ошибка на одной странице
+    приводит к повтору только этой страницы (с экспоненциальной задержкой и
+    случайным разбросом) без повторной загрузки полученных ранее страниц.
+    Курсор создаётся на один обход списка.
+    """
+
+    def __init__(self, fetch_page):
+        """
+        Args:
+            fetch_page (callable): Функция (номер страницы) -> (элементы, ответ).
+        """
+        self.fetch_page = fetch_page
+        self.pages = {}
+        self.last_page = None
+
+    @staticmethod
+    def last_page_from(response):
+        """
+        Определяет номер последней страницы по заголовку Link (rel="last").
+        
+        Args:
+            response (requests.Response): Ответ с первой страницей.
+            
+        Returns:
+            int: Номер последней страницы или 1, если страница единственная.
+        """
+        last = response.links.get("last")
+        if not last:
+            return 1
+        try:
+            return int(parse_qs(urlparse(last["url"]).query)["page"][0])
+        except (KeyError, ValueError, IndexError):
+            return 1
+
+    def fetch(self, page):
+        """
+        Возвращает элементы страницы, загружая её при необходимости.
+        
+        Args:
+            page (int): Номер страницы.
+            
+        Returns:
+            list: Элементы страницы.
+            
+        Raises:
+            Exception: Если страницу не удалось загрузить за PAGE_RETRIES попыток
+                или ошибка не является временной.
+        """
+        if page in self.pages:
+            return self.pages[page]
+        
+        attempt = 0
+        while True:
+            try:
+                items, response = self.fetch_page(page)
+                break
+            except Exception as e:
+                if not _is_transient_error(e) or attempt >= PAGE_RETRIES:
+                    raise
+                delay = _backoff_delay(attempt)
+                attempt += 1
+                print(f"Ошибка загрузки страницы {page}: {e}. Повтор через {delay:.1f} сек ({attempt}/{PAGE_RETRIES})")
+                time.sleep(delay)
+        
+        if page == 1:
+            self.last_page = self.last_page_from(response)
+        self.pages[page] = items
+        return items
 
 
 class GitHubParser:
-    def __init__(self, token=None):
+    def __init__(self, token=None, max_concurrency=None, rate_limiter=None, fetch_backend=None, incremental_sync=None,
+                 diff_filter=None, diff_cache=None, http_cache=None, session=None, diff_backend=None,
+                 api_url=None, record_file=None):
         self.headers = {"Accept": "application/vnd.github.v3+json"}
-        # Используем токен из переменных окружения, если не передан явно
+        # Используем токены из переменных окружения, если не переданы явно.
+        # Можно передать один токен, список или несколько токенов через запятую
         if token is None:
-            token = os.getenv("GITHUB_TOKEN")
+            token = os.getenv("GITHUB_TOKENS") or os.getenv("GITHUB_TOKEN")
+        tokens = parse_tokens(token)
+        token = tokens[0] if tokens else None
         if token:
             self.headers["Authorization"] = f"token {token}"
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_fixed(5),
-        retry=retry_if_exception_type((requests.exceptions.ConnectionError, requests.exceptions.HTTPError)),
-        reraise=True
-    )
-    def get_pr_list(self, owner, repo, state="open", author_login=None):
+        self.api_url = (api_url or GITHUB_API_URL).rstrip("/")
+        # Общая сессия с пулом соединений keep-alive к GitHub API
+        self.session = session or get_session(GITHUB_SESSION)
+        # Режим записи: ответы сохраняются в архив для сервера воспроизведения
+        record_file = record_file or GITHUB_RECORD_FILE
+        self.recorder = FixtureRecorder(record_file, self.api_url) if record_file else None
+
+        # Блокирующие запросы выполняются в отдельном пуле потоков,
+        # а семафор ограничивает число одновременных обращений к API
+        self.max_concurrency = max(1, max_concurrency or GITHUB_MAX_CONCURRENCY)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="github")
+        # Отдельный пул для страниц списков, чтобы вложенные запросы не ждали освобождения основного пула
+        self._page_executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="github-pages")
+        self._semaphore = None
+        self._semaphore_loop = None
+
+        # Пул токенов: у каждого токена свой общий для всех экземпляров планировщик лимитов,
+        # запрос уходит с токеном, у которого больше всего свободного бюджета
+        self.token_pool = TokenPool(tokens, scheduler_factory=(lambda key: rate_limiter) if rate_limiter else None)
+        if len(self.token_pool) > 1:
+            print(f"Используется пул из {len(self.token_pool)} токенов GitHub")
+
+        # GraphQL API недоступен без токена, в этом случае используем REST
+        self.fetch_backend = fetch_backend or GITHUB_FETCH_BACKEND
+        if self.fetch_backend == "graphql" and not token:
+            print("GraphQL API GitHub требует токен, используем REST API")
+            self.fetch_backend = "rest"
+
+        self.incremental_sync = GITHUB_INCREMENTAL_SYNC if incremental_sync is None else incremental_sync
+        # При diff_backend="git" API используется только для списка PR, а diff и коммиты
+        # вычисляются в локальном зеркале репозитория
+        self.diff_backend = diff_backend or GITHUB_DIFF_BACKEND
+        self._token = token
+        self._mirrors = {}
+        self._mirrors_lock = threading.Lock()
+        # Пофайловый фильтр diff перед отправкой кода в LLM
+        self.diff_filter = diff_filter or DiffFileFilter()
+        # Дисковый кэш diff по head SHA
+        self.diff_cache = diff_cache or DiffCache()
+        # Кэш ETag/Last-Modified для условных запросов: ответы 304 не расходуют лимит GitHub API
+        self.http_cache = http_cache or ConditionalRequestCache()
+
+    def _request(self, url, headers=None, resource=CORE_RESOURCE, json_body=None, stream=False):
+        """
+        Выполняет запрос к GitHub API с учётом лимитов запросов.
+        
+        Запрос выполняется с токеном пула, у которого больше всего свободного бюджета.
+        Перед запросом ожидает разрешения планировщика этого токена, после него обновляет
+        бюджет по заголовкам X-RateLimit-*. Запрос, отклонённый из-за лимита,
+        повторяется после паузы до сброса лимита или до истечения Retry-After.
+        GET-запросы выполняются как условные по данным self.http_cache; на ответ
+        304 Not Modified возвращается сохранённый ответ.
+        
+        Args:
+            url (str): Адрес запроса.
+            headers (dict, optional): Заголовки запроса. По умолчанию self.headers.
+            resource (str, optional): Ресурс лимита ("core", "search" или "graphql"). По умолчанию "core".
+            json_body (dict, optional): Тело POST-запроса. Если не задано, выполняется GET-запрос.
+            stream (bool, optional): Не загружать тело ответа сразу. По умолчанию False.
+            
+        Returns:
+            requests.Response: Успешный ответ.
+            
+        Raises:
+            requests.exceptions.HTTPError: Если произошла ошибка HTTP.
+        """
+        headers = headers or self.headers
+        attempt = 0
+        while True:
+            cached_entry = None
+            token, rate_limiter = self.token_pool.select(resource)
+            rate_limiter.acquire(resource)
+            response = None
+            try:
+                if json_body is not None:
+                    request_headers = self.token_pool.authorize(headers, token)
+                    response = self.session.post(url, headers=request_headers, json=json_body, timeout=default_timeout())
+                else:
+                    # Ключ HTTP-кэша не зависит от выбранного токена пула
+                    request_headers, cached_entry = self.http_cache.conditional_headers(url, headers)
+                    request_headers = self.token_pool.authorize(request_headers, token)
+                    response = self.session.get(url, headers=request_headers, stream=stream, timeout=default_timeout())
+            finally:
+                rate_limiter.release(resource, response)
+            
+            if is_rate_limited(response) and attempt < RATE_LIMIT_RETRIES:
+                attempt += 1
+                print(f"Превышен лимит GitHub API ({resource}), повтор после сброса лимита ({attempt}/{RATE_LIMIT_RETRIES})")
+                continue
+            response.raise_for_status()
+            if json_body is None:
+                response = self.http_cache.handle(url, headers, response, cached_entry)
+            if self.recorder:
+                self.recorder.record("GET" if json_body is None else "POST", url, response)
+            return response
+
+    def _get_semaphore(self):
+        """Возвращает семафор, привязанный к текущему event loop."""
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def _run_limited(self, func, *args, **kwargs):
+        """
+        Выполняет блокирующий метод в пуле потоков с ограничением числа одновременных запросов.
+        
+        Args:
+            func (callable): Синхронный метод клиента.
+            *args: Позиционные аргументы метода.
+            **kwargs: Именованные аргументы метода.
+            
+        Returns:
+            Any: Результат вызова метода.
+        """
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def get_pr_list_async(self, owner, repo, state="open", author_login=None, start_date=None, end_date=None):
+        """Асинхронная версия get_pr_list."""
+        return await self._run_limited(
+            self.get_pr_list, owner, repo, state=state, author_login=author_login,
+            start_date=start_date, end_date=end_date
+        )
+
+    async def get_pr_diff_async(self, owner, repo, pr_number):
+        """Асинхронная версия get_pr_diff."""
+        return await self._run_limited(self.get_pr_diff, owner, repo, pr_number)
+
+    async def fetch_pr_diff_async(self, owner, repo, pr_number, head_sha=None, closed=False):
+        """Асинхронная версия fetch_pr_diff."""
+        return await self._run_limited(self.fetch_pr_diff, owner, repo, pr_number, head_sha=head_sha, closed=closed)
+
+    async def get_pr_files_async(self, owner, repo, pr_number):
+        """Асинхронная версия get_pr_files."""
+        return await self._run_limited(self.get_pr_files, owner, repo, pr_number)
+
+    async def get_pr_commits_async(self, owner, repo, pr_number):
+        """Асинхронная версия get_pr_commits."""
+        return await self._run_limited(self.get_pr_commits, owner, repo, pr_number)
+
+    async def _fetch_pr_payload(self, owner, repo, pr):
+        """
+        Параллельно загружает diff и список коммитов одного PR.
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            pr (dict): Данные PR из списка.
+            
+        Returns:
+            tuple: (результат fetch_pr_diff, commits) или None при ошибке загрузки diff.
+        """
+        pr_number = pr["number"]
+        head_sha = (pr.get("head") or {}).get("sha")
+        closed = bool(pr.get("closed_at"))
+        if self.diff_backend == "git":
+            try:
+                return await self._run_limited(self.fetch_pr_payload_git, owner, repo, pr)
+            except Exception as e:
+                print(f"Не удалось получить PR #{pr_number} из локального зеркала, используем API: {e}")
+        try:
+            if DIFF_FILTER_USE_FILES_API and "files" not in pr:
+                try:
+                    pr["files"] = await self.get_pr_files_async(owner, repo, pr_number)
+                except Exception as e:
+                    print(f"Не удалось получить список файлов PR #{pr_number}, используем заголовки diff: {e}")
+            if "commit_list" in pr:
+                # Коммиты уже получены вместе с метаданными через GraphQL
+                diff_result = await self.fetch_pr_diff_async(owner, repo, pr_number, head_sha, closed)
+                return diff_result, pr["commit_list"]
+            diff_result, commits = await asyncio.gather(
+                self.fetch_pr_diff_async(owner, repo, pr_number, head_sha, closed),
+                self.get_pr_commits_async(owner, repo, pr_number)
+            )
+            return diff_result, commits
+        except Exception as e:
+            print(f"Ошибка загрузки данных PR #{pr_number}: {e}")
+            return None
+
+    @staticmethod
+    def _created_qualifier(start_date=None, end_date=None):
+        """
+        Формирует значение квалификатора created: для Search API.
+        
+        Args:
+            start_date (str, optional): Начальная дата в формате "YYYY-MM-DD".
+            end_date (str, optional): Конечная дата в формате "YYYY-MM-DD".
+            
+        Returns:
+            str: Значение квалификатора или None, если период не задан.
+        """
+        if start_date and end_date:
+            return f"{start_date}..{end_date}"
+        if start_date:
+            return f">={start_date}"
+        if end_date:
+            return f"<={end_date}"
+        return None
+
+    @staticmethod
+    def _page_url(base_url, page, per_page):
+        separator = "&" if "?" in base_url else "?"
+        return f"{base_url}{separator}page={page}&per_page={per_page}"
+
+    def _fetch_page_items(self, base_url, page, per_page=100, resource=CORE_RESOURCE, items_key=None):
+        """Загружает одну страницу списка и возвращает (элементы, ответ)."""
+        response = self._request(self._page_url(base_url, page, per_page), resource=resource)
+        payload = response.json()
+        items = payload.get(items_key, []) if items_key else payload
+        return items, response
+
+    def _paginate(self, base_url, resource=CORE_RESOURCE, per_page=100, items_key=None, page_filter=None, description=""):
+        """
+        Загружает все страницы списка GitHub API через PaginationCursor.
+        
+        Количество страниц определяется по заголовку Link первой страницы, после чего
+        остальные страницы загружаются параллельно (не более max_concurrency одновременно,
+        с учётом лимитов). Если задан page_filter, страницы загружаются волнами по
+        max_concurrency, чтобы можно было прекратить пагинацию досрочно.
+        Порядок элементов совпадает с порядком страниц. Неудачная страница повторяется
+        отдельно, не затрагивая уже загруженные; курсор не сохраняется между вызовами.
+        
+        Args:
+            base_url (str): Адрес списка без параметров page и per_page.
+            resource (str, optional): Ресурс лимита. По умолчанию "core".
+            per_page (int, optional): Размер страницы. По умолчанию 100.
+            items_key (str, optional): Поле ответа со списком элементов (для Search API - "items").
+            page_filter (callable, optional): Функция (элементы) -> (отобранные элементы, прекратить ли пагинацию).
+            description (str, optional): Описание списка для журнала.
+            
+        Returns:
+            list: Элементы всех страниц.
+        """
+        results = []
+        
+        def handle(page, items):
+            selected, stop = page_filter(items) if page_filter else (items, False)
+            results.extend(selected)
+            print(f"Получено {len(items)} элементов на странице {page}{description}, всего: {len(results)}")
+            return stop or len(items) < per_page
+        
+        # Курсор живёт только в рамках одного вызова: повторы неудачных страниц
+        # выполняются внутри него, а следующий вызов всегда начинает загрузку заново
+        cursor = PaginationCursor(partial(self._fetch_page_items, base_url, per_page=per_page,
+                                          resource=resource, items_key=items_key))
+        
+        if handle(1, cursor.fetch(1)) or cursor.last_page <= 1:
+            return results
+        
+        print(f"Всего страниц{description}: {cursor.last_page}, загружаем параллельно")
+        last_page = cursor.last_page
+        wave = self.max_concurrency if page_filter else last_page - 1
+        page = 2
+        while page <= last_page:
+            batch = range(page, min(page + wave, last_page + 1))
+            futures = [self._page_executor.submit(cursor.fetch, batch_page) for batch_page in batch]
+            for batch_page, future in zip(batch, futures):
+                if handle(batch_page, future.result()):
+                    for pending in futures:
+                        pending.cancel()
+                    return results
+            page = batch.stop
+        return results
+
+    @staticmethod
+    def _filter_listing_page(page_results, start_date=None, end_date=None, updated_since=None,
+                             created_key="created_at", updated_key="updated_at"):
+        """
+        Отбирает PR страницы списка, отсортированного по убыванию даты создания
+        (или даты изменения, если задан updated_since), и определяет, можно ли прекратить пагинацию.
+        
+        Args:
+            page_results (list): PR страницы.
+            start_date (str, optional): Начальная дата создания PR "YYYY-MM-DD".
+            end_date (str, optional): Конечная дата создания PR "YYYY-MM-DD".
+            updated_since (str, optional): Нижняя граница даты изменения PR.
+            created_key (str, optional): Поле с датой создания. По умолчанию "created_at".
+            updated_key (str, optional): Поле с датой изменения. По умолчанию "updated_at".
+            
+        Returns:
+            tuple: (отобранные PR, True если следующие страницы уже не нужны).
+        """
+        # Даты в формате ISO 8601 сравниваются как строки
+        selected = []
+        for pr in page_results:
+            created_day = pr[created_key][:10]
+            if updated_since:
+                if pr[updated_key] < updated_since:
+                    return selected, True
+            elif start_date and created_day < start_date:
+                return selected, True
+            if start_date and created_day < start_date:
+                continue
+            if end_date and created_day > end_date:
+                continue
+            selected.append(pr)
+        return selected, False
+
+    def get_pr_list(self, owner, repo, state="open", author_login=None, start_date=None, end_date=None, updated_since=None):
         """
         Получение списка pull request'ов из репозитория с поддержкой пагинации и фильтрации по автору.
         
+        Период создания PR передаётся в запрос: для Search API как квалификатор created:,
+        а для списка /pulls PR сортируются по дате создания и пагинация прекращается,
+        как только страница выходит за start_date. Если задан updated_since, возвращаются
+        только PR, изменённые начиная с этого момента.
+        
         Args:
             owner (str): Владелец репозитория.
             repo (str): Название репозитория.
             state (str, optional): Состояние PR (open/closed/all). По умолчанию "open".
             author_login (str, optional): Логин автора PR для фильтрации. По умолчанию None (все авторы).
+            start_date (str, optional): Начальная дата создания PR в формате "YYYY-MM-DD". По умолчанию None.
+            end_date (str, optional): Конечная дата создания PR в формате "YYYY-MM-DD". По умолчанию None.
+            updated_since (str, optional): Момент в формате "YYYY-MM-DDTHH:MM:SSZ", начиная с которого
+                PR считается изменённым. По умолчанию None (все PR).
             
         Returns:
             list: Список pull request'ов.
@@ -58,8 +590,6 @@ class GitHubParser:
             Exception: При других ошибках.
         """
         try:
-            all_prs = []
-            page = 1
             per_page = 100  # Максимальное количество результатов на странице
             
             if author_login:
@@ -67,46 +597,35 @@ class GitHubParser:
                 query = f"type:pr repo:{owner}/{repo} author:{author_login}"
                 if state != "all":
                     query += f" state:{state}"
-                url = f"https://api.github.com/search/issues?q={query}&page={page}&per_page={per_page}"
+                created = self._created_qualifier(start_date, end_date)
+                if created:
+                    query += f" created:{created}"
+                if updated_since:
+                    query += f" updated:>={updated_since}"
+                base_url = f"{self.api_url}/search/issues?q={quote(query)}&sort=created&order=desc"
             else:
-                # Стандартный запрос для получения всех PR
-                url = f"https://api.github.com/repos/{owner}/{repo}/pulls?state={state}&page={page}&per_page={per_page}"
+                # Стандартный запрос для получения всех PR, новые (или недавно изменённые) PR идут первыми
+                sort = "updated" if updated_since else "created"
+                base_url = f"{self.api_url}/repos/{owner}/{repo}/pulls?state={state}&sort={sort}&direction=desc"
+
+            print(f"Запрашиваем PR: {owner}/{repo}, состояние: {state}" + (f", автор: {author_login}" if author_login else ""))
+            if author_login:
+                # Для Search API данные находятся в поле "items"
+                all_prs = self._paginate(base_url, resource=SEARCH_RESOURCE, per_page=per_page,
+                                         items_key="items", description=f" ({owner}/{repo})")
+            else:
+                page_filter = None
+                if start_date or end_date or updated_since:
+                    page_filter = lambda items: self._filter_listing_page(items, start_date, end_date, updated_since)
+                all_prs = self._paginate(base_url, per_page=per_page, page_filter=page_filter,
+                                         description=f" ({owner}/{repo})")
 
-            while True:
-                print(f"Запрашиваем PR: страница {page}, {owner}/{repo}, состояние: {state}" + (f", автор: {author_login}" if author_login else ""))
-                response = requests.get(url, headers=self.headers)
-                response.raise_for_status()
-                
-                if author_login:
-                    # Для Search API данные находятся в поле "items"
-                    page_results = response.json().get("items", [])
-                else:
-                    page_results = response.json()
-                    
-                if not page_results:  # Если страница пустая, значит PR больше нет
-                    break
-                    
-                all_prs.extend(page_results)
-                print(f"Получено {len(page_results)} PR на странице {page}, всего: {len(all_prs)}")
-                
-                # Проверяем, есть ли следующая страница
-                if len(page_results) < per_page:
-                    break
-                    
-                page += 1
-                # Обновляем URL для следующей страницы
-                if author_login:
-                    url = f"https://api.github.com/search/issues?q={query}&page={page}&per_page={per_page}"
-                else:
-                    url = f"https://api.github.com/repos/{owner}/{repo}/pulls?state={state}&page={page}&per_page={per_page}"
-                
-                time.sleep(1)  # Задержка для избежания лимитов API
-                
             return all_prs
         except requests.exceptions.HTTPError as e:
-            if response.status_code == 403:
+            status_code = e.response.status_code if e.response is not None else None
+            if status_code == 403:
                 print("Превышен лимит запросов к API GitHub. Используйте токен или подождите перед повторной попыткой.")
-            elif response.status_code == 404:
+            elif status_code == 404:
                 print(f"Репозиторий {owner}/{repo} не найден или доступ ограничен.")
             else:
                 print(f"Ошибка HTTP при запросе PR: {e}")
@@ -118,85 +637,600 @@ class GitHubParser:
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_fixed(5),
-        retry=retry_if_exception_type((requests.exceptions.ConnectionError, requests.exceptions.HTTPError)),
+        retry=retry_if_exception(_is_transient_error),
         reraise=True
     )
-    def get_pr_diff(self, owner, repo, pr_number):
+    def fetch_pr_diff(self, owner, repo, pr_number, max_bytes=None, skip_path=None, head_sha=None, closed=False):
         """
-        Получение diff-файла для конкретного pull request'а.
+        Потоковая загрузка diff-файла pull request'а с ограничением объёма.
+        
+        Diff читается построчно; чтение прекращается, как только объём сохранённых
+        строк достигает max_bytes. Тела файлов, для которых skip_path возвращает True,
+        пропускаются (остаётся только заголовок "diff --git"). Загруженный diff
+        сохраняется в self.diff_cache: повторная загрузка выполняется только при
+        изменении head SHA, правил путей self.diff_filter или max_bytes, а diff закрытого
+        PR берётся из кэша без запроса к GitHub. Diff с явно переданной skip_path не кэшируется.
         
         Args:
             owner (str): Владелец репозитория.
             repo (str): Название репозитория.
             pr_number (int): Номер pull request'а.
+            max_bytes (int, optional): Максимальный объём diff в байтах. По умолчанию GITHUB_MAX_DIFF_BYTES.
+            skip_path (callable, optional): Функция (путь) -> bool для пропускаемых файлов.
+                По умолчанию правила путей self.diff_filter.
+            head_sha (str, optional): Head SHA PR, ключ записи в кэше.
+            closed (bool, optional): PR закрыт, и его diff больше не изменится.
             
         Returns:
-            str: Текст diff-файла.
+            dict: {"diff": текст diff, "truncated": был ли diff обрезан, "size": объём в байтах,
+                   "skipped_files": пропущенные файлы}.
             
         Raises:
             requests.exceptions.HTTPError: Если произошла ошибка HTTP.
             Exception: При других ошибках.
         """
+        max_bytes = GITHUB_MAX_DIFF_BYTES if max_bytes is None else max_bytes
+        # Diff с собственной функцией skip_path не кэшируется: её правила нельзя включить в ключ
+        variant = f"{self.diff_filter.path_rules_key()}:{max_bytes}" if skip_path is None else None
+        skip_path = skip_path or self.diff_filter.is_excluded_path
+        cached = self.diff_cache.get(owner, repo, pr_number, variant, head_sha=head_sha, closed=closed) if variant else None
+        if cached is not None:
+            print(f"Diff PR #{pr_number} взят из кэша")
+            return {key: cached[key] for key in ("diff", "truncated", "size", "skipped_files")}
         try:
-            url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}"
+            url = f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}"
             diff_headers = self.headers.copy()
             diff_headers["Accept"] = "application/vnd.github.v3.diff"
-            response = requests.get(url, headers=diff_headers)
-            response.raise_for_status()
-            return response.text
+            response = self._request(url, headers=diff_headers, stream=True)
+            try:
+                result = self._read_diff_stream(
+                    response.iter_content(chunk_size=DIFF_STREAM_CHUNK_SIZE), max_bytes, skip_path
+                )
+            finally:
+                response.close()
+            if result["truncated"]:
+                print(f"Diff PR #{pr_number} обрезан до {result['size']} байт (лимит {max_bytes})")
+            if result["skipped_files"]:
+                print(f"Diff PR #{pr_number}: пропущены файлы {', '.join(result['skipped_files'])}")
+            if variant:
+                self.diff_cache.put(owner, repo, pr_number, variant, result, head_sha=head_sha, closed=closed)
+            return result
         except requests.exceptions.HTTPError as e:
-            if response.status_code == 403:
+            if e.response is not None and e.response.status_code == 403:
                 print("Rate limit exceeded for diff request. Consider using a GitHub token.")
             raise e
         except Exception as e:
             print(f"Error fetching PR diff #{pr_number}: {e}")
             raise e
 
+    def _get_mirror(self, owner, repo):
+        """Возвращает локальное зеркало репозитория, общее для всех PR этого репозитория."""
+        with self._mirrors_lock:
+            key = (owner, repo)
+            if key not in self._mirrors:
+                self._mirrors[key] = GitMirror(owner, repo, token=self._token)
+            return self._mirrors[key]
+
+    def fetch_pr_payload_git(self, owner, repo, pr, max_bytes=None, skip_path=None):
+        """
+        Вычисляет diff и список коммитов PR в локальном зеркале репозитория без запросов к API.
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            pr (dict): Элемент списка PR (используются number, head.sha и base).
+            max_bytes (int, optional): Максимальный объём diff в байтах. По умолчанию GITHUB_MAX_DIFF_BYTES.
+            skip_path (callable, optional): Функция (путь) -> bool для пропускаемых файлов.
+            
+        Returns:
+            tuple: (результат в формате fetch_pr_diff, commits в формате get_pr_commits).
+            
+        Raises:
+            Exception: Если PR не найден в зеркале, git завершился с ошибкой или diff пуст
+                (тогда diff загружается через API).
+        """
+        max_bytes = GITHUB_MAX_DIFF_BYTES if max_bytes is None else max_bytes
+        skip_path = skip_path or self.diff_filter.is_excluded_path
+        if not (pr.get("base") or {}).get("sha"):
+            # Элементы Search API не содержат base: SHA базы берётся из метаданных PR
+            # и сохраняется в элементе списка (и в состоянии синхронизации)
+            details = self._request(f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr['number']}").json()
+            pr["base"] = {"ref": details["base"]["ref"], "sha": details["base"]["sha"]}
+            if not (pr.get("head") or {}).get("sha"):
+                pr["head"] = {"sha": details["head"]["sha"]}
+        mirror = self._get_mirror(owner, repo)
+        base, head = mirror.resolve(pr)
+        chunks = mirror.diff_chunks(base, head)
+        try:
+            result = self._read_diff_stream(chunks, max_bytes, skip_path)
+        finally:
+            chunks.close()
+        if not result["size"] and not result["skipped_files"]:
+            raise Exception(f"пустой diff PR #{pr['number']} в зеркале ({base}...{head})")
+        if result["truncated"]:
+            print(f"Diff PR #{pr['number']} обрезан до {result['size']} байт (лимит {max_bytes})")
+        commits = pr["commit_list"] if "commit_list" in pr else mirror.commits(base, head)
+        return result, commits
+
+    @staticmethod
+    def _read_diff_stream(chunks, max_bytes, skip_path):
+        """
+        Читает diff из потока фрагментов, пропуская исключённые файлы и соблюдая лимит объёма.
+        
+        Args:
+            chunks (iterable): Фрагменты diff (bytes), например response.iter_content().
+            max_bytes (int): Максимальный объём сохраняемого diff в байтах.
+            skip_path (callable): Функция (путь) -> bool для пропускаемых файлов.
+            
+        Returns:
+            dict: Результат в формате fetch_pr_diff.
+        """
+        kept = []
+        size = 0
+        truncated = False
+        skipping = False
+        skipped_files = []
+        buffer = b""
+        
+        def process(line):
+            nonlocal size, skipping
+            if line.startswith(b"diff --git "):
+                path = line.rsplit(b" b/", 1)[-1].decode("utf-8", errors="replace").strip()
+                skipping = skip_path(path)
+                if skipping:
+                    skipped_files.append(path)
+            elif skipping:
+                return True
+            if size + len(line) > max_bytes:
+                return False
+            kept.append(line)
+            size += len(line)
+            return True
+        
+        for chunk in chunks:
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if not process(line + b"\n"):
+                    truncated = True
+                    break
+            if truncated:
+                break
+        if not truncated and buffer and not process(buffer):
+            truncated = True
+        
+        return {
+            "diff": b"".join(kept).decode("utf-8", errors="replace"),
+            "truncated": truncated,
+            "size": size,
+            "skipped_files": skipped_files
+        }
+
+    def get_pr_files(self, owner, repo, pr_number):
+        """
+        Получение списка изменённых файлов pull request'а.
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            pr_number (int): Номер pull request'а.
+            
+        Returns:
+            list: Файлы с полями "filename", "status", "additions", "deletions", "changes".
+        """
+        url = f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}/files"
+        return [{"filename": item["filename"],
+                 "status": item["status"],
+                 "additions": item["additions"],
+                 "deletions": item["deletions"],
+                 "changes": item["changes"]}
+                for item in self._paginate(url, description=f" (файлы PR #{pr_number})")]
+
+    def get_pr_diff(self, owner, repo, pr_number):
+        """
+        Получение diff-файла для конкретного pull request'а.
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            pr_number (int): Номер pull request'а.
+            
+        Returns:
+            str: Текст diff-файла (не более GITHUB_MAX_DIFF_BYTES байт).
+            
+        Raises:
+            requests.exceptions.HTTPError: Если произошла ошибка HTTP.
+            Exception: При других ошибках.
+        """
+        return self.fetch_pr_diff(owner, repo, pr_number)["diff"]
+
     def format_code_from_diff(self, diff):
         """
-        Извлечение кода из diff-файла.
+        Подготовка кода из diff-файла для модели.
         
         Args:
             diff (str): Текст diff-файла.
             
         Returns:
-            str: Форматированный код с удалёнными строками diff-маркировки.
-        """
-        lines = diff.splitlines()
-        code = []
-        for line in lines:
-            if line.startswith('+') and not line.startswith('+++'):
-                code.append(line[1:])
-            elif line.startswith('-') and not line.startswith('---'):
-                continue
-            else:
-                code.append(line)
-        return "\n".join(code)
+            str: Компактный diff (см. compact_diff): заголовок "### путь" на файл, изменения
+                 с настраиваемым контекстом, свёрнутые пробельные правки и краткие удаления.
+        """
+        return compact_diff(diff)
 
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_fixed(5),
-        retry=retry_if_exception_type((requests.exceptions.ConnectionError, requests.exceptions.HTTPError)),
-        reraise=True
-    )
     def get_pr_commits(self, owner, repo, pr_number):
-        """Получает информацию о коммитах PR с повторными попытками при сетевых ошибках."""
+        """Получает информацию о всех коммитах PR (с пагинацией) с повторными попытками при сетевых ошибках."""
         try:
-            url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/commits"
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
+            url = f"{self.api_url}/repos/{owner}/{repo}/pulls/{pr_number}/commits"
             return [{"sha": commit["sha"], 
-                    "message": commit["commit"]["message"],
-                    "author": commit["commit"]["author"]["name"]} 
-                   for commit in response.json()]
+                     "message": commit["commit"]["message"],
+                     "author": commit["commit"]["author"]["name"]} 
+                    for commit in self._paginate(url, description=f" (коммиты PR #{pr_number})")]
         except Exception as e:
             print(f"Error fetching commits for PR #{pr_number}: {e}")
             return []
 
-    def parse_prs(self, owner, repo, start_date=None, end_date=None, author_login=None, save_to="pr_data.json"):
+    def _graphql(self, query, variables):
+        """
+        Выполняет запрос к GraphQL API GitHub.
+        
+        Args:
+            query (str): Текст GraphQL-запроса.
+            variables (dict): Переменные запроса.
+            
+        Returns:
+            dict: Поле data ответа.
+            
+        Raises:
+            Exception: Если GraphQL API вернул ошибки.
+        """
+        response = self._request(
+            f"{self.api_url}/graphql",
+            resource=GRAPHQL_RESOURCE,
+            json_body={"query": query, "variables": variables}
+        )
+        payload = response.json()
+        if payload.get("errors"):
+            messages = "; ".join(error.get("message", str(error)) for error in payload["errors"])
+            raise Exception(f"Ошибка GraphQL API: {messages}")
+        return payload["data"]
+
+    def _graphql_rest_of_connection(self, owner, repo, pr_number, query, connection, page_info):
+        """
+        Дозагружает оставшиеся страницы коммитов или файлов PR.
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            pr_number (int): Номер pull request'а.
+            query (str): GraphQL-запрос для соединения.
+            connection (str): Название соединения ("commits" или "files").
+            page_info (dict): pageInfo первой страницы.
+            
+        Returns:
+            list: Узлы оставшихся страниц.
+        """
+        nodes = []
+        while page_info["hasNextPage"]:
+            data = self._graphql(query, {"owner": owner, "repo": repo, "number": pr_number, "after": page_info["endCursor"]})
+            result = data["repository"]["pullRequest"][connection]
+            nodes.extend(result["nodes"])
+            page_info = result["pageInfo"]
+        return nodes
+
+    def _normalize_graphql_pr(self, owner, repo, node):
+        """
+        Приводит PR из GraphQL к формату элемента списка REST API и дополняет его
+        коммитами ("commit_list") и изменёнными файлами ("files").
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            node (dict): Узел PullRequest из ответа GraphQL.
+            
+        Returns:
+            dict: Данные PR.
+        """
+        pr_number = node["number"]
+        commit_nodes = node["commits"]["nodes"] + self._graphql_rest_of_connection(
+            owner, repo, pr_number, GRAPHQL_PR_COMMITS_QUERY, "commits", node["commits"]["pageInfo"]
+        )
+        file_nodes = node["files"]["nodes"] + self._graphql_rest_of_connection(
+            owner, repo, pr_number, GRAPHQL_PR_FILES_QUERY, "files", node["files"]["pageInfo"]
+        )
+        return {
+            "number": pr_number,
+            "html_url": node["url"],
+            "created_at": node["createdAt"],
+            "updated_at": node["updatedAt"],
+            "closed_at": node["closedAt"],
+            "merged_at": node["mergedAt"],
+            "state": node["state"].lower(),
+            "user": {"login": node["author"]["login"] if node.get("author") else "ghost"},
+            "head": {"sha": node["headRefOid"]},
+            "base": {"ref": node["baseRefName"], "sha": node["baseRefOid"]},
+            "commit_list": [{"sha": item["commit"]["oid"],
+                             "message": item["commit"]["message"],
+                             "author": (item["commit"].get("author") or {}).get("name")}
+                            for item in commit_nodes],
+            "files": [{"filename": item["path"],
+                       "additions": item["additions"],
+                       "deletions": item["deletions"],
+                       "status": item["changeType"].lower()}
+                      for item in file_nodes]
+        }
+
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_fixed(5),
+        retry=retry_if_exception(_is_transient_error),
+        reraise=True
+    )
+    def get_pr_list_graphql(self, owner, repo, state="open", author_login=None, start_date=None, end_date=None, updated_since=None):
+        """
+        Получение списка pull request'ов через GraphQL API вместе с коммитами и списком изменённых файлов.
+        
+        Один запрос возвращает до GRAPHQL_PAGE_SIZE PR, поэтому отдельные REST-запросы
+        коммитов не нужны; через REST загружается только сам diff.
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            state (str, optional): Состояние PR (open/closed/all). По умолчанию "open".
+            author_login (str, optional): Логин автора PR для фильтрации. По умолчанию None (все авторы).
+            start_date (str, optional): Начальная дата создания PR в формате "YYYY-MM-DD". По умолчанию None.
+            end_date (str, optional): Конечная дата создания PR в формате "YYYY-MM-DD". По умолчанию None.
+            updated_since (str, optional): Момент "YYYY-MM-DDTHH:MM:SSZ", начиная с которого
+                PR считается изменённым. По умолчанию None (все PR).
+            
+        Returns:
+            list: Список PR в формате элементов REST API с полями "commit_list" и "files".
+        """
+        all_prs = []
+        cursor = None
+        page = 1
+        
+        while True:
+            print(f"Запрашиваем PR через GraphQL: страница {page}, {owner}/{repo}, состояние: {state}" + (f", автор: {author_login}" if author_login else ""))
+            if author_login:
+                query = f"is:pr repo:{owner}/{repo} author:{author_login} sort:created-desc"
+                if state != "all":
+                    query += f" state:{state}"
+                created = self._created_qualifier(start_date, end_date)
+                if created:
+                    query += f" created:{created}"
+                if updated_since:
+                    query += f" updated:>={updated_since}"
+                data = self._graphql(GRAPHQL_SEARCH_QUERY, {"query": query, "first": GRAPHQL_PAGE_SIZE, "after": cursor})
+                connection = data["search"]
+            else:
+                data = self._graphql(GRAPHQL_REPOSITORY_QUERY, {
+                    "owner": owner, "repo": repo, "states": GRAPHQL_STATES.get(state, GRAPHQL_STATES["all"]),
+                    "first": GRAPHQL_PAGE_SIZE, "after": cursor,
+                    "orderBy": "UPDATED_AT" if updated_since else "CREATED_AT"
+                })
+                if data.get("repository") is None:
+                    raise Exception(f"Репозиторий {owner}/{repo} не найден или доступ ограничен.")
+                connection = data["repository"]["pullRequests"]
+            
+            # Поиск может вернуть issue без полей PR
+            nodes = [node for node in connection["nodes"] if node and "number" in node]
+            reached_boundary = False
+            if not author_login:
+                nodes, reached_boundary = self._filter_listing_page(
+                    nodes, start_date, end_date, updated_since, created_key="createdAt", updated_key="updatedAt"
+                )
+            all_prs.extend(self._normalize_graphql_pr(owner, repo, node) for node in nodes)
+            print(f"Получено {len(connection['nodes'])} PR на странице {page}, всего: {len(all_prs)}")
+            
+            if reached_boundary or not connection["pageInfo"]["hasNextPage"]:
+                break
+            cursor = connection["pageInfo"]["endCursor"]
+            page += 1
+        
+        return all_prs
+
+    async def _list_prs(self, owner, repo, author_login, start_date, end_date, sync_state=None):
+        """
+        Получает список PR за период с учётом состояния инкрементальной синхронизации.
+        
+        Для несинхронизированной части периода запрашивается полный список, а PR,
+        изменённые после high-water mark, запрашиваются всегда во всём периоде вместе
+        с сохранённым, чтобы high-water mark оставался верным для всего сохранённого периода.
+        Неизменённые PR берутся из сохранённого состояния.
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            author_login (str): Логин автора PR или None.
+            start_date (str): Начальная дата периода "YYYY-MM-DD" или None.
+            end_date (str): Конечная дата периода "YYYY-MM-DD" или None.
+            sync_state (RepoSyncState, optional): Состояние синхронизации. По умолчанию None.
+            
+        Returns:
+            tuple: (все PR периода, PR, полученные от GitHub в этом запуске).
+        """
+        list_method = self.get_pr_list_graphql if self.fetch_backend == "graphql" else self.get_pr_list
+        if sync_state is None or not sync_state.is_synced:
+            pr_list = await self._run_limited(
+                list_method, owner, repo, state="all", author_login=author_login,
+                start_date=start_date, end_date=end_date
+            )
+            return pr_list, pr_list
+        
+        ranges = sync_state.uncovered_ranges(start_date, end_date)
+        refresh_start, refresh_end = sync_state.refresh_bounds(start_date, end_date)
+        listings = [
+            self._run_limited(list_method, owner, repo, state="all", author_login=author_login,
+                              start_date=range_start, end_date=range_end)
+            for range_start, range_end in ranges
+        ]
+        # Изменённые PR запрашиваются всегда, даже если период не пересекается с сохранённым:
+        # mark_synced поднимает high-water mark, и без этого запроса изменения PR
+        # сохранённого периода между прошлым high-water mark и новым были бы пропущены
+        print(f"Инкрементальная синхронизация {owner}/{repo}: запрашиваем PR, изменённые с {sync_state.high_water_mark}")
+        listings.append(self._run_limited(
+            list_method, owner, repo, state="all", author_login=author_login,
+            start_date=refresh_start, end_date=refresh_end, updated_since=sync_state.high_water_mark
+        ))
+        
+        listed_prs = [pr for listing in await asyncio.gather(*listings) for pr in listing]
+        prs_by_number = {pr["number"]: pr for pr in sync_state.stored_prs(start_date, end_date)}
+        for pr in listed_prs:
+            if (not start_date or pr["created_at"][:10] >= start_date) and (not end_date or pr["created_at"][:10] <= end_date):
+                prs_by_number[pr["number"]] = pr
+        pr_list = sorted(prs_by_number.values(), key=lambda pr: pr["created_at"], reverse=True)
+        return pr_list, listed_prs
+
+    async def _analyze_code(self, pr_number, diff, code, packer=None):
+        """
+        Анализирует код PR в модели с учётом её контекста.
+        
+        Небольшие PR при переданном packer анализируются в пакетных запросах вместе
+        с другими. Код, не помещающийся в бюджет токенов одного запроса, разбивается
+        по границам файлов и ханков; части анализируются параллельно, а их результаты
+        объединяются в анализ той же структуры, что возвращает parse_analysis.
+        
+        Args:
+            pr_number (int): Номер PR (для журнала).
+            diff (str): Отфильтрованный diff PR.
+            code (str): Код PR, полученный format_code_from_diff.
+            packer (PrPacker, optional): Объединение небольших PR в пакетные запросы.
+            
+        Returns:
+            dict: Анализ кода или None.
+        """
+        await asyncio.to_thread(TOKEN_COUNTER.calibrate, code)
+        if packer and packer.accepts(code):
+            return await packer.analyze(pr_number, code)
+        budget = code_token_budget()
+        if TOKEN_COUNTER.count(code) <= budget:
+            response = await send_request_to_api_async(code)
+            return parse_analysis(response["choices"][0]["message"]["content"], CODE_ANALYSIS_SCHEMA) if response else None
+        
+        chunk_codes = [self.format_code_from_diff(chunk) for chunk in split_diff_chunks(diff, budget, TOKEN_COUNTER)]
+        chunk_codes = [chunk_code for chunk_code in chunk_codes if chunk_code.strip()]
+        print(f"PR #{pr_number}: код разбит на {len(chunk_codes)} частей до {budget} токенов")
+        responses = await asyncio.gather(*(send_request_to_api_async(chunk_code) for chunk_code in chunk_codes))
+        analyses = [parse_analysis(response["choices"][0]["message"]["content"], CODE_ANALYSIS_SCHEMA) if response else None
+                    for response in responses]
+        return merge_analyses(analyses, [TOKEN_COUNTER.count(chunk_code) for chunk_code in chunk_codes])
+
+    async def _process_pr(self, owner, repo, pr, analysis_dir, sync_state=None, packer=None, hunk_index=None):
+        """
+        Загружает diff и коммиты одного PR, анализирует его код и сохраняет анализ в файл.
+        
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            pr (dict): Элемент списка PR.
+            analysis_dir (str): Каталог для файлов анализа PR.
+            sync_state (RepoSyncState, optional): Состояние синхронизации для сохранения результата.
+            packer (PrPacker, optional): Объединение небольших PR в пакетные запросы.
+            hunk_index (HunkIndex, optional): Отпечатки ханков отчета; PR, все изменения которого
+                уже встречались в других PR, получает их анализ без запроса к модели.
+            
+        Returns:
+            dict: Данные PR или None при ошибке.
+        """
+        try:
+            pr_number = pr["number"]
+            analysis_file = os.path.join(analysis_dir, f"pr_{pr_number}_analysis.json")
+            payload = await self._fetch_pr_payload(owner, repo, pr)
+            if payload is None:
+                if sync_state:
+                    sync_state.remember(pr, None, None)
+                return None
+            diff_result, commits = payload
+            diff = diff_result["diff"]
+            analysis = None
+            reused_from = None
+            fingerprints = set()
+        
+            # Определяем статус PR
+            pr_status = "open"
+            if pr.get("closed_at"):
+                if pr.get("merged_at"):
+                    pr_status = "merged"
+                else:
+                    pr_status = "rejected"  # PR был закрыт, но не объединен - отклонен
+        
+            try:
+                # Оставляем только файлы, пригодные для ревью
+                filtered = self.diff_filter.filter_diff(diff, files=pr.get("files"))
+                if filtered["excluded"]:
+                    print(f"PR #{pr_number}: исключено из анализа файлов: {len(filtered['excluded'])}")
+                code = self.format_code_from_diff(filtered["diff"])
+            
+                # Анализируем код PR; одновременные запросы vLLM объединяет в батчи
+                if code.strip():
+                    # Бэкпорты и cherry-pick уже проанализированных изменений не отправляются в модель
+                    fingerprints = hunk_fingerprints(filtered["diff"]) if hunk_index else set()
+                    sources = await hunk_index.claim(pr["html_url"], fingerprints) if hunk_index else None
+                    if sources:
+                        analysis = await hunk_index.reuse(sources)
+                        if analysis:
+                            reused_from = sources
+                            print(f"PR #{pr_number}: все изменения уже есть в {', '.join(sources)}, анализ использован повторно")
+                    if analysis is None:
+                        try:
+                            analysis = await self._analyze_code(pr_number, filtered["diff"], code, packer)
+                        finally:
+                            if hunk_index and not sources:
+                                hunk_index.resolve(pr["html_url"], analysis)
+                else:
+                    print(f"PR #{pr_number}: после фильтрации не осталось кода для анализа")
+                if analysis:
+                    # Сохраняем анализ каждого PR в отдельный файл
+                    self.save_to_json(analysis, analysis_file)
+            
+                # Учёт токенов: насколько компактный формат сократил diff PR
+                diff_tokens = TOKEN_COUNTER.count(diff)
+                code_tokens = TOKEN_COUNTER.count(code) if code.strip() else 0
+                print(f"PR #{pr_number}: ~{code_tokens} токенов вместо ~{diff_tokens} в исходном diff "
+                      f"(-{100 - code_tokens * 100 // max(diff_tokens, 1)}%)")
+            
+                data = {
+                    "author": pr["user"]["login"],
+                    "code": code,
+                    "id_pr": pr_number,
+                    "link": pr["html_url"],
+                    "created_at": datetime.strptime(pr["created_at"], "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S"),
+                    "status": pr_status,
+                    "closed_at": datetime.strptime(pr["closed_at"], "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S") if pr.get("closed_at") else None,
+                    "merged_at": datetime.strptime(pr["merged_at"], "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S") if pr.get("merged_at") else None,
+                    "commits": commits
+                }
+                data["tokens"] = {"diff": diff_tokens, "code": code_tokens}
+                if reused_from:
+                    data["analysis_reused_from"] = reused_from
+                if diff_result["truncated"]:
+                    data["diff_truncated"] = True
+                if diff_result["skipped_files"]:
+                    data["diff_skipped_files"] = diff_result["skipped_files"]
+                if filtered["excluded"]:
+                    data["excluded_files"] = filtered["excluded"]
+                if "files" in pr:
+                    data["files"] = pr["files"]
+                if sync_state:
+                    sync_state.remember(pr, data, analysis, analysis_version(), sorted(fingerprints))
+                print(f"PR #{pr_number} успешно обработан")
+                return data
+            except Exception as e:
+                print(f"Ошибка обработки PR #{pr_number}: {e}")
+                if sync_state:
+                    sync_state.remember(pr, None, None)
+                return None
+        finally:
+            if hunk_index:
+                # PR, не дошедший до регистрации ханков, не должен задерживать следующие
+                await hunk_index.release(pr["html_url"])
+
+    async def parse_prs(self, owner, repo, start_date=None, end_date=None, author_login=None, save_to="pr_data.json", hunk_index=None):
         """
         Получение и анализ pull request'ов из репозитория за указанный период времени для указанного автора.
-        Включает как принятые, так и отклоненные PR.
+        Включает как принятые, так и отклоненные PR. Diff и коммиты всех PR загружаются
+        параллельно с ограничением max_concurrency, а код анализируется одновременно
+        до LLM_MAX_IN_FLIGHT запросами к модели. Порядок результатов соответствует списку PR.
         
         Args:
             owner (str): Владелец репозитория.
@@ -205,6 +1239,8 @@ class GitHubParser:
             end_date (str, optional): Конечная дата периода в формате "YYYY-MM-DD". По умолчанию None (без ограничения).
             author_login (str, optional): Логин автора PR для фильтрации. По умолчанию None (все авторы).
             save_to (str, optional): Путь для сохранения данных. По умолчанию "pr_data.json".
+            hunk_index (HunkIndex, optional): Общий индекс ханков для нескольких репозиториев отчета.
+                По умолчанию создаётся новый (если HUNK_DEDUP включён).
             
         Returns:
             list: Список словарей с данными о pull request'ах.
@@ -231,15 +1267,18 @@ class GitHubParser:
             except ValueError:
                 print(f"Неверный формат конечной даты: {end_date}. Используйте формат YYYY-MM-DD.")
         
-        # Получаем все PR (включая открытые, закрытые и объединенные)
-        pr_list = self.get_pr_list(owner, repo, state="all", author_login=author_login)
+        # Получаем PR за период (включая открытые, закрытые и объединенные),
+        # период передаётся в запрос к GitHub только для корректно заданных дат
+        window_start = start_date if start_datetime else None
+        window_end = end_date if end_datetime else None
+        sync_state = RepoSyncState.load(owner, repo, author_login) if self.incremental_sync else None
+        pr_list, listed_prs = await self._list_prs(owner, repo, author_login, window_start, window_end, sync_state)
         
         if not pr_list:
             print(f"Предупреждение: PR не найдены для репозитория {owner}/{repo}" + (f" с автором {author_login}" if author_login else ""))
             return []
         
-        parsed_data = []
-
+        selected_prs = []
         for pr in pr_list:
             pr_number = pr["number"]
             print(f"Обработка PR #{pr_number} от {pr['created_at']} (автор: {pr['user']['login']})")
@@ -254,44 +1293,74 @@ class GitHubParser:
             if end_datetime and pr_created_at > end_datetime:
                 print(f"PR #{pr_number} пропущен: дата создания ({pr_created_at}) позже {end_datetime}")
                 continue
-            
-            # Определяем статус PR
-            pr_status = "open"
-            if pr.get("closed_at"):
-                if pr.get("merged_at"):
-                    pr_status = "merged"
-                else:
-                    pr_status = "rejected"  # PR был закрыт, но не объединен - отклонен
-            
+            selected_prs.append(pr)
+        
+        # PR, не изменившиеся с прошлой синхронизации, берём из сохранённого состояния
+        reused = {}
+        if sync_state:
+            for pr in selected_prs:
+                record = sync_state.get_unchanged(pr, analysis_version())
+                if record:
+                    reused[pr["number"]] = record
+            if reused:
+                print(f"{len(reused)} PR не изменились с прошлой синхронизации и не будут загружаться повторно")
+        prs_to_fetch = [pr for pr in selected_prs if pr["number"] not in reused]
+        
+        # Загружаем и анализируем остальные PR параллельно: анализ PR начинается сразу
+        # после загрузки его diff, не дожидаясь остальных
+        print(f"Загрузка и анализ {len(prs_to_fetch)} PR (одновременно до {self.max_concurrency} запросов к GitHub "
+              f"и до {LLM_MAX_IN_FLIGHT} запросов к модели)")
+        # Небольшие PR анализируются пакетами по несколько PR в одном запросе
+        packer = PrPacker() if LLM_PACK_SMALL_PRS else None
+        if hunk_index is None and HUNK_DEDUP:
+            hunk_index = HunkIndex()
+        # Ханки регистрируются в порядке создания PR: источником становится исходный PR,
+        # а не его бэкпорт, независимо от того, чей diff загрузился раньше. PR из состояния
+        # синхронизации тоже регистрируются, чтобы отметки не зависели от того, какие PR
+        # загружались заново
+        prs_by_age = sorted(prs_to_fetch, key=lambda pr: pr["created_at"])
+        stored_registrations = []
+        if hunk_index:
+            hunk_index.expect([pr["html_url"] for pr in sorted(selected_prs, key=lambda pr: pr["created_at"])])
+            stored_registrations = [
+                hunk_index.add(pr["html_url"], set(reused[pr["number"]].get("fingerprints") or []), reused[pr["number"]]["analysis"])
+                for pr in selected_prs if pr["number"] in reused
+            ]
+        results, _ = await asyncio.gather(
+            asyncio.gather(*(self._process_pr(owner, repo, pr, analysis_dir, sync_state, packer, hunk_index)
+                             for pr in prs_by_age)),
+            asyncio.gather(*stored_registrations)
+        )
+        if packer and packer.requests:
+            print(f"Пакетные запросы: {packer.packed_prs} небольших PR проанализированы в {packer.requests} запросах")
+        reused_count = sum(1 for data in results if data and data.get("analysis_reused_from"))
+        if reused_count:
+            print(f"{reused_count} PR повторяют изменения других PR, их анализ использован повторно")
+        data_by_number = {pr["number"]: data for pr, data in zip(prs_by_age, results)}
+        diff_tokens = sum(data["tokens"]["diff"] for data in results if data)
+        if diff_tokens:
+            code_tokens = sum(data["tokens"]["code"] for data in results if data)
+            print(f"Код {sum(1 for data in results if data)} PR: ~{code_tokens} токенов вместо ~{diff_tokens} в исходных diff "
+                  f"(-{100 - code_tokens * 100 // diff_tokens}%)")
+        
+        parsed_data = []
+        for pr in selected_prs:
+            pr_number = pr["number"]
+            if pr_number in reused:
+                record = reused[pr_number]
+                if record["analysis"] is not None:
+                    self.save_to_json(record["analysis"], os.path.join(analysis_dir, f"pr_{pr_number}_analysis.json"))
+                parsed_data.append(record["data"])
+                print(f"PR #{pr_number} взят из состояния синхронизации")
+            elif data_by_number.get(pr_number) is not None:
+                parsed_data.append(data_by_number[pr_number])
+
+        if sync_state:
+            sync_state.mark_synced(window_start, window_end, listed_prs)
             try:
-                diff = self.get_pr_diff(owner, repo, pr_number)
-                code = self.format_code_from_diff(diff)
-                
-                # Анализируем код PR через API
-                response = send_request_to_api(code)
-                if response:
-                    analysis = parse_analysis(response["choices"][0]["message"]["content"])
-                    if analysis:
-                        # Сохраняем анализ каждого PR в отдельный файл
-                        analysis_file = os.path.join(analysis_dir, f"pr_{pr_number}_analysis.json")
-                        self.save_to_json(analysis, analysis_file)
-                
-                data = {
-                    "author": pr["user"]["login"],
-                    "code": code,
-                    "id_pr": pr_number,
-                    "link": pr["html_url"],
-                    "created_at": datetime.strptime(pr["created_at"], "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S"),
-                    "status": pr_status,
-                    "closed_at": datetime.strptime(pr["closed_at"], "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S") if pr.get("closed_at") else None,
-                    "merged_at": datetime.strptime(pr["merged_at"], "%Y-%m-%dT%H:%M:%SZ").strftime("%Y-%m-%d %H:%M:%S") if pr.get("merged_at") else None,
-                    "commits": self.get_pr_commits(owner, repo, pr_number)
-                }
-                parsed_data.append(data)
-                print(f"PR #{pr_number} успешно обработан")
+                sync_state.save()
             except Exception as e:
-                print(f"Ошибка обработки PR #{pr_number}: {e}")
-                continue
+                print(f"Не удалось сохранить состояние синхронизации {owner}/{repo}: {e}")
 
         return parsed_data
 
@@ -357,7 +1426,7 @@ class GitHubParser:
             print(f"Error saving to JSON: {e}")
             raise e
 
-    def analyze_all_prs(self, repo_links, start_date=None, end_date=None, author_login=None, save_to="analysis_report.json"):
+    async def analyze_all_prs(self, repo_links, start_date=None, end_date=None, author_login=None, save_to="analysis_report.json"):
         """
         Получение и анализ pull request'ов из нескольких репозиториев за указанный период времени для указанного автора.
         
@@ -386,6 +1455,8 @@ class GitHubParser:
         
         all_prs_data = []
         all_prs_analysis_data = []
+        # Отпечатки ханков общие для всех репозиториев отчета
+        hunk_index = HunkIndex() if HUNK_DEDUP else None
         
         # Списки для отслеживания ошибок
         repos_not_found = []
@@ -410,7 +1481,7 @@ class GitHubParser:
             
             # Получаем PR данные
             try:
-                prs_data = self.parse_prs(owner, repo, start_date, end_date, author_login)
+                prs_data = await self.parse_prs(owner, repo, start_date, end_date, author_login, hunk_index=hunk_index)
                 
                 # Проверяем есть ли PR
                 if not prs_data:
@@ -505,7 +1576,7 @@ class GitHubParser:
         save_to_path = os.path.join(analysis_dir, save_to)
         
         # Отправляем собранные данные на финальный анализ
-        final_report = self.generate_final_report(all_prs_analysis_data)
+        final_report = await self.generate_final_report(all_prs_analysis_data)
         
         if final_report and save_to:
             self.save_to_json(final_report, save_to_path)
@@ -532,6 +1603,12 @@ class GitHubParser:
                 pr_files['pr_info']['status'] = pr_data.get('status', 'open')
                 pr_files['pr_info']['closed_at'] = pr_data.get('closed_at')
                 pr_files['pr_info']['merged_at'] = pr_data.get('merged_at')
+                # Отмечаем PR, diff которых был обрезан по лимиту объёма
+                if pr_data.get('diff_truncated'):
+                    pr_files['pr_info']['diff_truncated'] = True
+                # Отмечаем PR, анализ которых взят у PR с теми же изменениями
+                if pr_data.get('analysis_reused_from'):
+                    pr_files['pr_info']['analysis_reused_from'] = pr_data['analysis_reused_from']
                 full_report["детальный_анализ"].append(pr_files)
         
         # Добавляем статистику по статусам PR
@@ -556,28 +1633,59 @@ class GitHubParser:
         self.save_to_json(full_report, full_report_path)
         print(f"Полный отчет сохранен в {full_report_path}")
 
-    def generate_final_report(self, prs_analysis_data):
-        # Чтение инструкции из файла
-        base_dir = os.path.dirname(__file__)
-        instruction_path = os.path.join(base_dir, "promts/final_report_instruction.txt")
+    async def _summarize_batch(self, prompt, instruction, label):
+        """
+        Обобщает одну часть данных итогового отчета; при ответе не по схеме запрос повторяется.
         
-        try:
-            with open(instruction_path, "r", encoding="utf-8") as f:
-                instruction = f.read().strip()
-        except FileNotFoundError:
-            print(f"Ошибка: Файл инструкции {instruction_path} не найден. Используем встроенную инструкцию.")
-            instruction = """Создай обобщенный итоговый отчет по всем PR
-            {
-                "overall_score": number,
-                "recurring_issues": [
-                    {"issue": "Общие ошибки по всем PR. Не указывай навание перемен, файлов и так далее"},
-                ],
-                "antipatterns": [
-                    {"name": "название антипаттерна"}
-                ]
-            }"""
-        except Exception as e:
-            print(f"Ошибка при чтении файла инструкции: {e}. Используем встроенную инструкцию.")
+        Args:
+            prompt (str): JSON-массив анализов PR или частичных отчетов.
+            instruction (str): Инструкция запроса.
+            label (str): Название части для журнала.
+            
+        Returns:
+            dict: Отчет в формате FINAL_REPORT_SCHEMA или None.
+        """
+        for attempt in range(1, MAX_ANALYSIS_RETRIES + 1):
+            try:
+                print(f"{label}: отправка запроса (попытка {attempt}/{MAX_ANALYSIS_RETRIES})...")
+                response = await send_request_to_api_async(prompt, instruction=instruction, schema=FINAL_REPORT_SCHEMA)
+                
+                if response and "choices" in response:
+                    result = parse_analysis(response["choices"][0]["message"]["content"], FINAL_REPORT_SCHEMA)
+                    if result:
+                        return result
+                
+                # Ответ не соответствует схеме - повторяем сразу: ожидание здесь не поможет
+                print(f"{label}: получен некорректный ответ от API, повтор...")
+            except Exception as e:
+                print(f"{label}: ошибка при обобщении: {str(e)}")
+                if attempt < MAX_ANALYSIS_RETRIES:
+                    print(f"Повторная попытка через {RETRY_INTERVAL} сек...")
+                    await asyncio.sleep(RETRY_INTERVAL)
+        print(f"{label}: все попытки исчерпаны.")
+        return None
+
+    async def generate_final_report(self, prs_analysis_data):
+        """
+        Строит итоговый отчет по анализам PR иерархическим обобщением (map-reduce).
+        
+        Анализы PR группируются в части, укладывающиеся в бюджет токенов запроса,
+        и обобщаются параллельно. Полученные частичные отчеты (с числом PR в каждом)
+        объединяются так же, уровень за уровнем, пока не останется один отчет. Промпт
+        не обрезается, поэтому в отчет попадают все PR, а число последовательных
+        запросов растёт логарифмически с числом PR.
+        
+        Args:
+            prs_analysis_data (list): Анализы PR с полем pr_info.
+            
+        Returns:
+            dict: Итоговый отчет; при неудаче - пустой отчет с overall_score "N/A".
+        """
+        # Инструкции читаются с диска один раз (см. reload_instructions)
+        base_dir = os.path.dirname(__file__)
+        instruction = load_instruction(FINAL_REPORT_INSTRUCTION_FILE)
+        if instruction is None:
+            print("Используем встроенную инструкцию итогового отчета.")
             instruction = """Создай обобщенный итоговый отчет по всем PR
             {
                 "overall_score": number,
@@ -588,55 +1696,79 @@ class GitHubParser:
                     {"name": "название антипаттерна"}
                 ]
             }"""
+        merge_instruction = load_instruction(MERGE_REPORT_INSTRUCTION_FILE) or instruction
+        empty_report = {
+            "overall_score": "N/A",
+            "recurring_issues": [],
+            "antipatterns": []
+        }
         
         # Используем относительный путь к директории анализа
         analysis_dir = os.path.join(base_dir, "pr_files")
         os.makedirs(analysis_dir, exist_ok=True)
         
-        # Обрабатываем все PR без ограничения по количеству
-        analysis_batch = prs_analysis_data
-        
-        # Сохраняем пример запроса в файл в папке pr_files
-        prompt = instruction + "\n" + json.dumps(analysis_batch, ensure_ascii=False, indent=2)
-        report_file = os.path.join(analysis_dir, "final_report_prompt.txt")
-        with open(report_file, "w", encoding="utf-8") as f:
-            f.write(prompt)
+        # Компактный JSON без отступов: в часть помещается больше PR
+        items = [json.dumps(analysis, ensure_ascii=False, separators=(",", ":")) for analysis in prs_analysis_data]
+        weights = [1] * len(items)
+        await asyncio.to_thread(TOKEN_COUNTER.calibrate, "\n".join(items[:50]))
         
-        # Добавляем повторные попытки отправки запроса
-        retries = 0
-        while retries < MAX_ANALYSIS_RETRIES:
-            try:
-                print(f"Отправка запроса для анализа PR (попытка {retries+1}/{MAX_ANALYSIS_RETRIES})...")
-                response = send_request_to_api(prompt)
-                
-                if response and "choices" in response:
-                    result = parse_analysis(response["choices"][0]["message"]["content"])
-                    if result:
-                        return result
-                
-                # Если результат пустой или неверный формат, повторяем попытку
-                print(f"Получен некорректный ответ от API, повтор через {RETRY_INTERVAL} сек...")
-                retries += 1
-                time.sleep(RETRY_INTERVAL)
-            except Exception as e:
-                print(f"Ошибка при анализе PR: {str(e)}")
-                retries += 1
-                if retries < MAX_ANALYSIS_RETRIES:
-                    print(f"Повторная попытка через {RETRY_INTERVAL} сек...")
-                    time.sleep(RETRY_INTERVAL)
-                else:
-                    print("Все попытки анализа исчерпаны.")
+        if FINDING_CLUSTERING:
+            # Повторяющиеся находки сводятся в кластеры локально; если сводка помещается в один
+            # запрос, модель получает её вместо анализов PR
+            statistics = await asyncio.to_thread(cluster_findings, prs_analysis_data)
+            summary = json.dumps(statistics, ensure_ascii=False, separators=(",", ":"))
+            summary_tokens = TOKEN_COUNTER.count(summary)
+            raw_tokens = sum(TOKEN_COUNTER.count(item) for item in items)
+            if summary_tokens <= code_token_budget(instruction):
+                print(f"Находки {len(items)} PR сведены в кластеры: ~{summary_tokens} токенов вместо ~{raw_tokens}")
+                items = [summary]
+                weights = [len(prs_analysis_data)]
+            else:
+                print(f"Сводка кластеров (~{summary_tokens} токенов) не помещается в запрос, обобщаем анализы PR")
         
-        # Если все попытки неудачны, возвращаем пустой отчет вместо None
-        return {
-            "overall_score": "N/A",
-            "recurring_issues": [],
-            "antipatterns": []
-        }
+        level = 1
+        level_instruction = instruction
+        while True:
+            # На уровнях объединения в части не меньше двух отчетов, иначе число отчетов не сокращается
+            batches = pack_batches(items, code_token_budget(level_instruction), TOKEN_COUNTER, min_size=1 if level == 1 else 2)
+            prompts = ["[\n" + ",\n".join(items[index] for index in batch) + "\n]" for batch in batches]
+            if len(batches) == 1:
+                # Сохраняем запрос верхнего уровня в файл в папке pr_files
+                report_file = os.path.join(analysis_dir, "final_report_prompt.txt")
+                with open(report_file, "w", encoding="utf-8") as f:
+                    f.write(level_instruction + "\n" + prompts[0])
+                report = await self._summarize_batch(prompts[0], level_instruction, f"Итоговый отчет (уровень {level})")
+                return report or empty_report
+            
+            print(f"Итоговый отчет, уровень {level}: {len(items)} записей в {len(batches)} частях")
+            reports = await asyncio.gather(*(
+                self._summarize_batch(prompt, level_instruction, f"Уровень {level}, часть {number}/{len(batches)}")
+                for number, prompt in enumerate(prompts, 1)
+            ))
+            
+            partial_reports = []
+            partial_weights = []
+            for batch, report in zip(batches, reports):
+                if report is None:
+                    print(f"Уровень {level}: часть из {sum(weights[index] for index in batch)} PR не обобщена и пропущена")
+                    continue
+                report["pr_count"] = sum(weights[index] for index in batch)
+                partial_reports.append(report)
+                partial_weights.append(report["pr_count"])
+            if not partial_reports:
+                return empty_report
+            if len(partial_reports) == 1:
+                partial_reports[0].pop("pr_count")
+                return partial_reports[0]
+            
+            items = [json.dumps(report, ensure_ascii=False, separators=(",", ":")) for report in partial_reports]
+            weights = partial_weights
+            level_instruction = merge_instruction
+            level += 1
 
 def main():
     parser = GitHubParser()
-    results = parser.analyze_all_prs(["https://github.com/microsoft/vscode-docs"], start_date=None, end_date=None, author_login="mrljtster", save_to="analysis_report.json")
+    results = asyncio.run(parser.analyze_all_prs(["https://github.com/microsoft/vscode-docs"], start_date=None, end_date=None, author_login="mrljtster", save_to="analysis_report.json"))
     print(f"Получено PR: {len(results)}")
 
 if __name__ == "__main__":
@@ -0,0 +1,158 @@
+import asyncio
+import json
+import os
+from analysis_schema import CODE_ANALYSIS_SCHEMA, packed_analysis_schema, validate
+from сode_analysis import (ANALYSIS_CACHE, FALLBACK_INSTRUCTION, MODEL, TOKEN_COUNTER, code_token_budget,
+                           load_instruction, parse_analysis, send_request_to_api_async)
+
+# Объединять небольшие PR в один запрос к модели
+LLM_PACK_SMALL_PRS = os.getenv("LLM_PACK_SMALL_PRS", "true").lower() in ("1", "true", "yes")
+# PR считается небольшим, если его код не длиннее этого числа токенов
+LLM_PACK_SMALL_PR_TOKENS = int(os.getenv("LLM_PACK_SMALL_PR_TOKENS", "600"))
+# Бюджет кода (токенов) и максимальное число PR в одном пакетном запросе; число PR
+# ограничено ещё и тем, что ответ со всеми анализами должен уместиться в LLM_MAX_OUTPUT_TOKENS
+LLM_PACK_MAX_TOKENS = int(os.getenv("LLM_PACK_MAX_TOKENS", "3000"))
+LLM_PACK_MAX_PRS = max(1, int(os.getenv("LLM_PACK_MAX_PRS", "4")))
+# Сколько ждать следующие небольшие PR перед отправкой неполного пакета (секунд)
+LLM_PACK_WAIT = float(os.getenv("LLM_PACK_WAIT", "1.0"))
+PACKED_INSTRUCTION_FILE = "promts/packed_analysis_instruction.txt"
+
+
+class PrPacker:
+    """
+    Объединяет анализ небольших PR в пакетные запросы к модели.
+
+    Небольшие PR накапливаются, пока не заполнится бюджет токенов или число PR
+    в пакете, либо пока не пройдёт LLM_PACK_WAIT секунд с первого PR в пакете.
+    Пакет отправляется одним запросом: инструкция передаётся один раз, а модель
+    возвращает массив анализов с номерами PR, который разбирается на анализы
+    отдельных PR. Анализы сохраняются в кэш под ключом пакетной инструкции и кода
+    каждого PR, поэтому повторный запуск использует кэш независимо от состава пакетов,
+    а одиночные запросы не получают ответы, полученные с другой инструкцией. PR, анализ которых
+    не удалось получить из ответа, анализируются отдельными запросами.
+
+    Экземпляр привязан к event loop, в котором вызывается analyze.
+    """
+
+    def __init__(self, max_tokens=None, max_prs=None, wait=None):
+        self.max_tokens = LLM_PACK_MAX_TOKENS if max_tokens is None else max_tokens
+        self.max_prs = LLM_PACK_MAX_PRS if max_prs is None else max_prs
+        self.wait = LLM_PACK_WAIT if wait is None else wait
+        self.requests = 0
+        self.packed_prs = 0
+        self._pending = []
+        self._pending_tokens = 0
+        self._timer = None
+        self._tasks = set()
+
+    @staticmethod
+    def accepts(code):
+        """Проверяет, достаточно ли мал код PR для пакетного запроса."""
+        return TOKEN_COUNTER.count(code) <= LLM_PACK_SMALL_PR_TOKENS
+
+    @staticmethod
+    def _single_instruction():
+        return load_instruction() or FALLBACK_INSTRUCTION
+
+    def _packed_instruction(self):
+        return self._single_instruction() + "\n\n" + (load_instruction(PACKED_INSTRUCTION_FILE) or "")
+
+    async def analyze(self, pr_number, code):
+        """
+        Анализирует код небольшого PR в составе пакета.
+
+        Args:
+            pr_number (int): Номер PR.
+            code (str): Код PR, полученный format_code_from_diff.
+
+        Returns:
+            dict: Анализ кода или None.
+        """
+        cached = await asyncio.to_thread(ANALYSIS_CACHE.get, ANALYSIS_CACHE.key(MODEL, self._single_instruction(), code))
+        if cached is None:
+            cached = await asyncio.to_thread(ANALYSIS_CACHE.get, ANALYSIS_CACHE.key(MODEL, self._packed_instruction(), code))
+        if cached is not None:
+            print(f"PR #{pr_number}: анализ взят из кэша")
+            return parse_analysis(cached["choices"][0]["message"]["content"], CODE_ANALYSIS_SCHEMA)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        tokens = TOKEN_COUNTER.count(code)
+        budget = min(self.max_tokens, code_token_budget(self._packed_instruction()))
+        if self._pending and self._pending_tokens + tokens > budget:
+            self._flush()
+        self._pending.append((pr_number, code, future))
+        self._pending_tokens += tokens
+        if self._pending_tokens >= budget or len(self._pending) >= self.max_prs:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.wait, self._flush)
+        return await future
+
+    def _flush(self):
+        """Отправляет накопленный пакет."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = self._pending
+        self._pending = []
+        self._pending_tokens = 0
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch):
+        results = {}
+        if len(batch) > 1:
+            try:
+                results = await self._send_packed(batch)
+            except Exception as e:
+                print(f"Ошибка пакетного запроса: {e}")
+        missing = [(pr_number, code) for pr_number, code, _ in batch if pr_number not in results]
+        if len(batch) > 1 and missing:
+            print(f"Пакетный запрос: нет анализа для PR {', '.join(f'#{pr_number}' for pr_number, _ in missing)}, "
+                  f"анализируем их отдельно")
+        responses = await asyncio.gather(*(send_request_to_api_async(code) for _, code in missing), return_exceptions=True)
+        for (pr_number, _), response in zip(missing, responses):
+            if isinstance(response, Exception):
+                print(f"PR #{pr_number}: ошибка анализа: {response}")
+                continue
+            if response:
+                results[pr_number] = parse_analysis(response["choices"][0]["message"]["content"], CODE_ANALYSIS_SCHEMA)
+        for pr_number, _, future in batch:
+            if not future.done():
+                future.set_result(results.get(pr_number))
+
+    async def _send_packed(self, batch):
+        """
+        Отправляет пакет одним запросом и разбирает ответ на анализы отдельных PR.
+
+        Returns:
+            dict: {номер PR: анализ} для PR, анализ которых есть в ответе и соответствует схеме.
+        """
+        pr_numbers = [pr_number for pr_number, _, _ in batch]
+        prompt = "\n\n".join(f"=== PR #{pr_number} ===\n{code}" for pr_number, code, _ in batch)
+        self.requests += 1
+        self.packed_prs += len(batch)
+        print(f"Пакетный запрос: {len(batch)} небольших PR ({', '.join(f'#{pr_number}' for pr_number in pr_numbers)})")
+        schema = packed_analysis_schema(pr_numbers)
+        packed_instruction = self._packed_instruction()
+        response = await send_request_to_api_async(prompt, instruction=packed_instruction, schema=schema)
+        packed = parse_analysis(response["choices"][0]["message"]["content"], schema) if response else None
+        if not packed:
+            return {}
+
+        codes = {pr_number: code for pr_number, code, _ in batch}
+        results = {}
+        for item in packed["analyses"]:
+            analysis = dict(item)
+            pr_number = analysis.pop("pr_id")
+            if pr_number in results or validate(analysis, CODE_ANALYSIS_SCHEMA):
+                continue
+            results[pr_number] = analysis
+            # Анализ из пакета сохраняется под ключом пакетной инструкции и кода этого PR:
+            # одиночный запрос его не использует, а смена любой из инструкций делает запись устаревшей
+            cached = {"choices": [{"message": {"role": "assistant", "content": json.dumps(analysis, ensure_ascii=False)}}]}
+            await asyncio.to_thread(ANALYSIS_CACHE.put, ANALYSIS_CACHE.key(MODEL, packed_instruction, codes[pr_number]), cached)
+        return results
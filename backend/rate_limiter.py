@@ -0,0 +1,212 @@
+import threading
+import time
+
+# Ресурсы GitHub API с отдельными лимитами (значение заголовка X-RateLimit-Resource)
+CORE_RESOURCE = "core"
+SEARCH_RESOURCE = "search"
+GRAPHQL_RESOURCE = "graphql"
+
+# Доля бюджета, начиная с которой запросы равномерно распределяются до момента сброса
+PACING_THRESHOLD = 0.1
+# Пауза для вторичных лимитов GitHub, если сервер не прислал Retry-After (секунд)
+SECONDARY_LIMIT_PAUSE = 60
+# Запас времени после X-RateLimit-Reset, чтобы не попасть на ещё не сброшенный лимит
+RESET_MARGIN = 1.0
+
+
+class RateLimitScheduler:
+    """
+    Планировщик запросов к GitHub API на основе заголовков X-RateLimit-* и Retry-After.
+
+    Для каждого ресурса (core, search, graphql) хранится остаток бюджета и время сброса.
+    Запросы выполняются без задержек, пока бюджет велик, равномерно распределяются
+    на последних PACING_THRESHOLD процентах бюджета и приостанавливаются ровно
+    до X-RateLimit-Reset, когда бюджет исчерпан. Потокобезопасен.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._blocked_until = 0.0
+
+    def _bucket(self, resource):
+        if resource not in self._buckets:
+            self._buckets[resource] = {
+                "limit": None,
+                "remaining": None,
+                "reset": 0.0,
+                "in_flight": 0,
+                "next_at": 0.0
+            }
+        return self._buckets[resource]
+
+    def _delay(self, bucket, now):
+        """Возвращает необходимую паузу перед запросом или 0, если запрос можно выполнить."""
+        if self._blocked_until > now:
+            return self._blocked_until - now
+
+        if bucket["remaining"] is None:
+            return 0
+
+        if bucket["reset"] and bucket["reset"] <= now:
+            # Окно сброшено: до первого ответа считаем бюджет полным
+            bucket["remaining"] = bucket["limit"]
+            bucket["next_at"] = 0.0
+            if bucket["remaining"] is None:
+                return 0
+
+        available = bucket["remaining"] - bucket["in_flight"]
+        if available <= 0:
+            return max(bucket["reset"] - now, 0) + RESET_MARGIN
+
+        if bucket["next_at"] > now:
+            return bucket["next_at"] - now
+        return 0
+
+    def acquire(self, resource=CORE_RESOURCE):
+        """
+        Блокирует поток, пока запрос к ресурсу не станет допустимым, и резервирует для него бюджет.
+
+        Args:
+            resource (str, optional): Ресурс GitHub API. По умолчанию "core".
+        """
+        while True:
+            with self._lock:
+                now = time.time()
+                bucket = self._bucket(resource)
+                delay = self._delay(bucket, now)
+                if delay <= 0:
+                    bucket["in_flight"] += 1
+                    if bucket["limit"] and bucket["remaining"] is not None:
+                        available = bucket["remaining"] - bucket["in_flight"]
+                        if available < bucket["limit"] * PACING_THRESHOLD and bucket["reset"] > now:
+                            # Остаток бюджета равномерно распределяем до момента сброса
+                            bucket["next_at"] = now + (bucket["reset"] - now) / max(available, 1)
+                    return
+            print(f"Лимит GitHub API ({resource}): ожидание {delay:.1f} сек")
+            time.sleep(delay)
+
+    def release(self, resource=CORE_RESOURCE, response=None):
+        """
+        Освобождает резерв запроса и обновляет состояние бюджета по заголовкам ответа.
+
+        Args:
+            resource (str, optional): Ресурс, для которого резервировался бюджет.
+            response (requests.Response, optional): Ответ GitHub API. None, если запрос не выполнен.
+        """
+        with self._lock:
+            bucket = self._bucket(resource)
+            bucket["in_flight"] = max(bucket["in_flight"] - 1, 0)
+            if response is None:
+                return
+
+            headers = response.headers
+            now = time.time()
+            actual_resource = headers.get("X-RateLimit-Resource", resource)
+            target = self._bucket(actual_resource)
+
+            try:
+                if "X-RateLimit-Remaining" in headers:
+                    target["remaining"] = int(headers["X-RateLimit-Remaining"])
+                if "X-RateLimit-Limit" in headers:
+                    target["limit"] = int(headers["X-RateLimit-Limit"])
+                if "X-RateLimit-Reset" in headers:
+                    target["reset"] = float(headers["X-RateLimit-Reset"])
+            except ValueError:
+                pass
+
+            retry_after = headers.get("Retry-After")
+            if retry_after is not None:
+                try:
+                    self._blocked_until = max(self._blocked_until, now + float(retry_after))
+                except ValueError:
+                    pass
+            elif is_rate_limited(response) and target["remaining"] != 0:
+                # Вторичный лимит без Retry-After: GitHub рекомендует подождать не менее минуты
+                self._blocked_until = max(self._blocked_until, now + SECONDARY_LIMIT_PAUSE)
+
+    def headroom(self, resource=CORE_RESOURCE):
+        """
+        Возвращает доступный бюджет ресурса без ожидания.
+
+        Args:
+            resource (str, optional): Ресурс GitHub API. По умолчанию "core".
+
+        Returns:
+            tuple: (число доступных запросов, время, до которого ресурс недоступен, или 0).
+                   Если бюджет ещё неизвестен, число запросов равно бесконечности.
+        """
+        with self._lock:
+            now = time.time()
+            bucket = self._bucket(resource)
+            if self._blocked_until > now:
+                return 0, self._blocked_until
+            if bucket["remaining"] is None or (bucket["reset"] and bucket["reset"] <= now):
+                if bucket["limit"] is None:
+                    return float("inf"), 0
+                return bucket["limit"] - bucket["in_flight"], 0
+            available = bucket["remaining"] - bucket["in_flight"]
+            if available <= 0:
+                return 0, bucket["reset"] + RESET_MARGIN
+            return available, 0
+
+    def status(self):
+        """Возвращает копию текущего состояния бюджетов по ресурсам."""
+        with self._lock:
+            return {name: dict(bucket) for name, bucket in self._buckets.items()}
+
+
+def is_rate_limited(response):
+    """
+    Проверяет, отклонён ли запрос из-за ограничения частоты запросов.
+
+    Args:
+        response (requests.Response): Ответ GitHub API.
+
+    Returns:
+        bool: True, если ответ означает превышение первичного или вторичного лимита.
+    """
+    if response.status_code not in (403, 429):
+        return False
+    if response.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in response.headers:
+        return True
+    try:
+        return "rate limit" in response.text.lower()
+    except Exception:
+        return False
+
+
+_shared_schedulers = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_scheduler(key):
+    """
+    Возвращает общий планировщик для ключа (обычно токена), чтобы параллельные
+    задачи формирования отчетов учитывали один и тот же бюджет.
+
+    Args:
+        key (str): Ключ планировщика.
+
+    Returns:
+        RateLimitScheduler: Планировщик для ключа.
+    """
+    with _shared_lock:
+        if key not in _shared_schedulers:
+            _shared_schedulers[key] = RateLimitScheduler()
+        return _shared_schedulers[key]
+
+
+def shared_status():
+    """
+    Возвращает состояние бюджетов всех общих планировщиков процесса.
+
+    Returns:
+        dict: {ключ планировщика: {ресурс: бюджет}}; токены сокращены до последних 4 символов.
+    """
+    with _shared_lock:
+        schedulers = dict(_shared_schedulers)
+    return {
+        key if key == "anonymous" else f"...{key[-4:]}": scheduler.status()
+        for key, scheduler in schedulers.items()
+    }
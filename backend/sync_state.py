@@ -0,0 +1,270 @@
+import json
+import os
+import re
+import tempfile
+from datetime import datetime, timedelta
+
+# Каталог для хранения состояния синхронизации репозиториев
+SYNC_STATE_DIR = os.getenv("SYNC_STATE_DIR", os.path.join(os.path.dirname(__file__), "pr_files", "sync"))
+
+# Границы для неограниченного периода
+MIN_DATE = "0001-01-01"
+MAX_DATE = "9999-12-31"
+
+
+# Поля элемента списка PR, которые сохраняются в состоянии синхронизации
+PR_FIELDS = ("number", "html_url", "created_at", "updated_at", "closed_at", "merged_at", "state", "files")
+
+
+def _compact_pr(pr):
+    """Оставляет в элементе списка PR только поля, нужные для повторного использования."""
+    compact = {key: pr[key] for key in PR_FIELDS if key in pr}
+    compact["user"] = {"login": (pr.get("user") or {}).get("login")}
+    if pr.get("head"):
+        compact["head"] = {"sha": pr["head"].get("sha")}
+    if pr.get("base"):
+        # SHA базы нужен для вычисления diff в локальном зеркале (GitMirror.resolve)
+        compact["base"] = {"ref": pr["base"].get("ref"), "sha": pr["base"].get("sha")}
+    return compact
+
+
+def _shift_day(day, days):
+    """Сдвигает дату в формате "YYYY-MM-DD" на указанное число дней."""
+    return (datetime.strptime(day, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+
+
+def _touches(end, start):
+    """Проверяет, что период, заканчивающийся end, перекрывается или смыкается с периодом, начинающимся start."""
+    return end >= start or _shift_day(end, 1) >= start
+
+
+def _span_days(start, end):
+    return (datetime.strptime(end, "%Y-%m-%d") - datetime.strptime(start, "%Y-%m-%d")).days
+
+
+class RepoSyncState:
+    """
+    Состояние инкрементальной синхронизации PR одного репозитория (и автора).
+
+    Хранит период создания PR, для которого список PR полностью синхронизирован,
+    верхнюю границу updated_at (high-water mark) на момент синхронизации и уже
+    обработанные PR вместе с их данными и анализом. Последующие запуски запрашивают
+    у GitHub только новые и изменённые PR, а остальные берут из состояния. Анализ
+    сохранённого PR используется, только если он получен той же моделью с той же
+    инструкцией (analysis_version).
+    """
+
+    def __init__(self, owner, repo, author_login=None, directory=None):
+        self.owner = owner
+        self.repo = repo
+        self.author_login = author_login
+        self.directory = directory or SYNC_STATE_DIR
+        self.high_water_mark = None
+        self.covered_since = None
+        self.covered_until = None
+        self.prs = {}
+
+    @property
+    def path(self):
+        author = self.author_login or "all"
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{self.owner}__{self.repo}__{author}")
+        return os.path.join(self.directory, f"{name}.json")
+
+    @classmethod
+    def load(cls, owner, repo, author_login=None, directory=None):
+        """
+        Загружает состояние синхронизации из файла или создаёт пустое.
+
+        Args:
+            owner (str): Владелец репозитория.
+            repo (str): Название репозитория.
+            author_login (str, optional): Логин автора PR. По умолчанию None (все авторы).
+            directory (str, optional): Каталог состояний. По умолчанию SYNC_STATE_DIR.
+
+        Returns:
+            RepoSyncState: Состояние синхронизации.
+        """
+        state = cls(owner, repo, author_login, directory)
+        try:
+            with open(state.path, "r", encoding="utf-8") as f:
+                stored = json.load(f)
+            state.high_water_mark = stored.get("high_water_mark")
+            state.covered_since = stored.get("covered_since")
+            state.covered_until = stored.get("covered_until")
+            state.prs = stored.get("prs", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Не удалось прочитать состояние синхронизации {state.path}: {e}. Выполняем полную синхронизацию.")
+        return state
+
+    def save(self):
+        """Атомарно сохраняет состояние синхронизации в файл."""
+        os.makedirs(self.directory, exist_ok=True)
+        # Уникальный временный файл: одновременные запуски для того же репозитория
+        # не перезаписывают файл друг друга во время записи
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.directory,
+                                         prefix=os.path.basename(self.path), suffix=".tmp", delete=False) as f:
+            tmp_path = f.name
+            json.dump({
+                "owner": self.owner,
+                "repo": self.repo,
+                "author_login": self.author_login,
+                "high_water_mark": self.high_water_mark,
+                "covered_since": self.covered_since,
+                "covered_until": self.covered_until,
+                "prs": self.prs
+            }, f, ensure_ascii=False)
+        try:
+            os.replace(tmp_path, self.path)
+        except OSError:
+            os.remove(tmp_path)
+            raise
+
+    @property
+    def is_synced(self):
+        return self.high_water_mark is not None
+
+    def refresh_bounds(self, start_date=None, end_date=None):
+        """
+        Возвращает период, в котором нужно запросить PR, изменённые после high-water mark:
+        запрошенный период вместе с уже синхронизированным, чтобы high-water mark
+        оставался верным для всего сохранённого периода.
+
+        Returns:
+            tuple: (start_date, end_date), где None означает отсутствие границы.
+        """
+        if not self.is_synced:
+            return start_date, end_date
+        start = min(start_date or MIN_DATE, self.covered_since or MIN_DATE)
+        end = max(end_date or MAX_DATE, self.covered_until or MAX_DATE)
+        return (None if start == MIN_DATE else start), (None if end == MAX_DATE else end)
+
+    def uncovered_ranges(self, start_date=None, end_date=None):
+        """
+        Возвращает части периода, для которых список PR ещё не синхронизирован.
+
+        Args:
+            start_date (str, optional): Начало периода "YYYY-MM-DD". None - без ограничения.
+            end_date (str, optional): Конец периода "YYYY-MM-DD". None - без ограничения.
+
+        Returns:
+            list: Список пар (start_date, end_date), где None означает отсутствие границы.
+        """
+        start = start_date or MIN_DATE
+        end = end_date or MAX_DATE
+        if not self.is_synced:
+            return [(start_date, end_date)]
+
+        covered_start = self.covered_since or MIN_DATE
+        covered_end = self.covered_until or MAX_DATE
+        if end < covered_start or start > covered_end:
+            return [(start_date, end_date)]
+
+        ranges = []
+        if start < covered_start:
+            ranges.append((start_date, _shift_day(covered_start, -1)))
+        if end > covered_end:
+            ranges.append((_shift_day(covered_end, 1), end_date))
+        return ranges
+
+    def stored_prs(self, start_date=None, end_date=None):
+        """
+        Возвращает сохранённые PR, созданные в указанном периоде.
+
+        Args:
+            start_date (str, optional): Начало периода "YYYY-MM-DD".
+            end_date (str, optional): Конец периода "YYYY-MM-DD".
+
+        Returns:
+            list: Элементы списка PR в формате GitHub API.
+        """
+        result = []
+        for record in self.prs.values():
+            created_day = record["pr"]["created_at"][:10]
+            if start_date and created_day < start_date:
+                continue
+            if end_date and created_day > end_date:
+                continue
+            result.append(record["pr"])
+        return result
+
+    def get_unchanged(self, pr, analysis_version=None):
+        """
+        Возвращает сохранённую запись PR, если он не менялся с прошлой синхронизации.
+
+        PR без кода для анализа (после фильтрации) - тоже готовый результат. Запись
+        с анализом возвращается, только если анализ получен в той же версии.
+
+        Args:
+            pr (dict): Элемент списка PR в формате GitHub API.
+            analysis_version (str, optional): Текущая версия анализа (модель и инструкция).
+
+        Returns:
+            dict: Запись с полями "data" и "analysis" (None для PR без кода) или None.
+        """
+        record = self.prs.get(str(pr["number"]))
+        if not record or record.get("data") is None:
+            return None
+        if record["pr"].get("updated_at") != pr.get("updated_at"):
+            return None
+        if record.get("analysis") is None:
+            # Анализ не получен из-за ошибки - PR обрабатывается заново
+            return None if (record["data"].get("code") or "").strip() else record
+        if analysis_version and record.get("analysis_version") != analysis_version:
+            return None
+        return record
+
+    def remember(self, pr, data, analysis, analysis_version=None, fingerprints=None):
+        """
+        Сохраняет обработанный PR.
+
+        Args:
+            pr (dict): Элемент списка PR в формате GitHub API.
+            data (dict): Данные PR, сформированные parse_prs.
+            analysis (dict): Результат анализа кода PR или None.
+            analysis_version (str, optional): Версия анализа (модель и инструкция).
+            fingerprints (list, optional): Отпечатки ханков PR (см. hunk_index).
+        """
+        self.prs[str(pr["number"])] = {
+            "pr": _compact_pr(pr), "data": data, "analysis": analysis, "analysis_version": analysis_version,
+            "fingerprints": fingerprints or []
+        }
+
+    def mark_synced(self, start_date, end_date, listed_prs):
+        """
+        Фиксирует, что период полностью синхронизирован, и обновляет high-water mark.
+
+        Синхронизированный период объединяется с ранее сохранённым, если они
+        перекрываются или смыкаются; иначе остаётся более длинный из них. PR из
+        listing, которые не были обработаны в этом запуске (вне периода отчета),
+        сохраняются без данных и будут обработаны при следующем обращении.
+
+        Args:
+            start_date (str): Начало синхронизированного периода или None.
+            end_date (str): Конец синхронизированного периода или None.
+            listed_prs (list): PR, полученные от GitHub в этом запуске.
+        """
+        was_synced = self.is_synced
+        for pr in listed_prs:
+            record = self.prs.get(str(pr["number"]))
+            if not record or record["pr"].get("updated_at") != pr.get("updated_at"):
+                self.prs[str(pr["number"])] = {"pr": _compact_pr(pr), "data": None, "analysis": None}
+
+        marks = [pr["updated_at"] for pr in listed_prs if pr.get("updated_at")]
+        if self.high_water_mark:
+            marks.append(self.high_water_mark)
+        if marks:
+            self.high_water_mark = max(marks)
+        elif not self.high_water_mark:
+            self.high_water_mark = datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ")
+
+        start, end = start_date or MIN_DATE, end_date or MAX_DATE
+        if was_synced:
+            covered_start, covered_end = self.covered_since or MIN_DATE, self.covered_until or MAX_DATE
+            if _touches(end, covered_start) and _touches(covered_end, start):
+                start, end = min(start, covered_start), max(end, covered_end)
+            elif _span_days(covered_start, covered_end) > _span_days(start, end):
+                start, end = covered_start, covered_end
+        self.covered_since = None if start == MIN_DATE else start
+        self.covered_until = None if end == MAX_DATE else end
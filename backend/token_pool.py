@@ -0,0 +1,79 @@
+import itertools
+import threading
+import time
+from rate_limiter import CORE_RESOURCE, get_shared_scheduler
+
+
+def parse_tokens(value):
+    """
+    Разбирает один токен, список токенов или строку токенов через запятую.
+
+    Args:
+        value (str | list): Токены GitHub.
+
+    Returns:
+        list: Непустые токены без повторов в исходном порядке.
+    """
+    if not value:
+        return []
+    items = value if isinstance(value, (list, tuple)) else value.split(",")
+    return list(dict.fromkeys(item.strip() for item in items if item and item.strip()))
+
+
+class TokenPool:
+    """
+    Пул токенов GitHub с раздельным учётом лимитов.
+
+    У каждого токена свой планировщик лимитов (общий для процесса, см. get_shared_scheduler).
+    Каждый запрос отправляется с токеном, у которого больше всего свободного бюджета
+    выбранного ресурса; при равенстве токены чередуются по кругу. Исчерпанные токены
+    не используются до сброса их лимита, а если исчерпаны все, выбирается токен
+    с ближайшим сбросом. Без токенов пул работает анонимно.
+    """
+
+    def __init__(self, tokens=None, scheduler_factory=None):
+        self.tokens = parse_tokens(tokens) or [None]
+        scheduler_factory = scheduler_factory or get_shared_scheduler
+        self.schedulers = {token: scheduler_factory(token or "anonymous") for token in self.tokens}
+        self._lock = threading.Lock()
+        self._rotation = itertools.count()
+
+    def __len__(self):
+        return len([token for token in self.tokens if token])
+
+    def select(self, resource=CORE_RESOURCE):
+        """
+        Выбирает токен для очередного запроса.
+
+        Args:
+            resource (str, optional): Ресурс GitHub API. По умолчанию "core".
+
+        Returns:
+            tuple: (токен или None, его RateLimitScheduler).
+        """
+        with self._lock:
+            start = next(self._rotation) % len(self.tokens)
+        ordered = self.tokens[start:] + self.tokens[:start]
+        now = time.time()
+
+        best, best_available, earliest, earliest_until = None, 0, None, None
+        for token in ordered:
+            available, blocked_until = self.schedulers[token].headroom(resource)
+            if blocked_until > now:
+                # Токен исчерпан или заблокирован вторичным лимитом до blocked_until
+                if earliest_until is None or blocked_until < earliest_until:
+                    earliest, earliest_until = token, blocked_until
+                continue
+            if best is None or available > best_available:
+                best, best_available = token, available
+        token = best if best is not None else earliest
+        return token, self.schedulers[token]
+
+    @staticmethod
+    def authorize(headers, token):
+        """Возвращает копию заголовков с авторизацией выбранным токеном."""
+        if not token:
+            return headers
+        authorized = dict(headers)
+        authorized["Authorization"] = f"token {token}"
+        return authorized
@@ -1,24 +1,55 @@
 import requests
+import asyncio
 import json
 import os
 import time
+import statistics
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 import argparse
 import tkinter as tk
 from tkinter import filedialog
 from dotenv import load_dotenv
+from http_session import LLM_MAX_IN_FLIGHT, LLM_SESSION, default_timeout, get_session
+from analysis_cache import AnalysisCache
+from analysis_schema import CODE_ANALYSIS_SCHEMA, validate
+from chunking import LLM_CHUNK_TOKENS, LLM_MAX_OUTPUT_TOKENS, PROMPT_OVERHEAD_TOKENS, TokenCounter
 
 # Загружаем переменные из .env файла
 load_dotenv()
 
 BACKEND_PORT = os.getenv("BACKEND_PORT")
 API_URL = f"http://vllm:{BACKEND_PORT}/v1/chat/completions"
+TOKENIZE_URL = f"http://vllm:{BACKEND_PORT}/tokenize"
 
 # Получаем название модели из .env
 MODEL = os.getenv("MODEL_NAME")
 HEADERS = {"Content-Type": "application/json"}
 
+INSTRUCTION_FILE = "promts/code_analysis_instruction.txt"
+FALLBACK_INSTRUCTION = """Пиши на русском.Проанализируй следующий код или данные и предоставь анализ в JSON формате."""
+
 MAX_RETRIES = 3
 RETRY_DELAY = 2
+# Таймаут ожидания ответа модели (секунд)
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+# Генерация, ограниченная JSON Schema ответа (response_format vLLM): модель не может вернуть невалидный JSON
+LLM_GUIDED_DECODING = os.getenv("LLM_GUIDED_DECODING", "true").lower() in ("1", "true", "yes")
+
+# Оценка числа токенов, калибруемая токенизатором обслуживаемой модели
+TOKEN_COUNTER = TokenCounter(TOKENIZE_URL, MODEL)
+
+# Кэш ответов модели: повторный анализ того же кода той же моделью и инструкцией не выполняется
+ANALYSIS_CACHE = AnalysisCache()
+
+# Инструкции, прочитанные с диска (файл читается один раз до вызова reload_instructions)
+_instructions = {}
+_instructions_lock = threading.Lock()
+
+_llm_executor = None
+_llm_semaphore = None
+_llm_semaphore_loop = None
 
 # Читает содержимое файла с кодом для анализа
 def __read_input_file(file_path):
@@ -34,7 +65,7 @@ def __read_input_file(file_path):
         return None
 
 # Чтение инструкции из файла
-def __read_instruction_file(file_path="promts/code_analysis_instruction.txt"):
+def __read_instruction_file(file_path=INSTRUCTION_FILE):
     try:
         # Получаем абсолютный путь к директории, где находится сам скрипт
         base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -50,32 +81,72 @@ def __read_instruction_file(file_path="promts/code_analysis_instruction.txt"):
         print(f"Ошибка при чтении файла инструкции: {e}")
         return None
 
-# Отправляет запрос к API для анализа кода.
-def send_request_to_api(prompt):
-    instruction = __read_instruction_file()
+# Возвращает инструкцию, прочитанную с диска один раз
+def load_instruction(file_path=INSTRUCTION_FILE):
+    with _instructions_lock:
+        if _instructions.get(file_path) is None:
+            _instructions[file_path] = __read_instruction_file(file_path)
+        return _instructions[file_path]
+
+# Сбрасывает прочитанные инструкции, чтобы изменения в файлах применились без перезапуска
+def reload_instructions():
+    with _instructions_lock:
+        _instructions.clear()
+    return load_instruction() is not None
+
+# Сообщения чата: неизменная инструкция в системном сообщении образует общий префикс
+# всех запросов, и vLLM (automatic prefix caching) повторно использует её KV-кэш
+def build_messages(instruction, prompt):
+    return [
+        {"role": "system", "content": instruction},
+        {"role": "user", "content": f"```code\n{prompt}\n```"}
+    ]
+
+# Число токенов, доступное для кода в одном запросе
+def __prompt_token_budget(instruction):
+    return TOKEN_COUNTER.context_tokens - LLM_MAX_OUTPUT_TOKENS - TOKEN_COUNTER.count(instruction) - PROMPT_OVERHEAD_TOKENS
+
+# Версия анализа - ключ модели и инструкции: сохранённые анализы другой версии устарели
+def analysis_version():
+    return ANALYSIS_CACHE.key(MODEL, load_instruction() or FALLBACK_INSTRUCTION, "")
+
+# Бюджет токенов на одну часть данных в запросе с инструкцией (по умолчанию - инструкцией анализа кода)
+def code_token_budget(instruction=None):
+    budget = __prompt_token_budget(instruction if instruction is not None else load_instruction() or "")
+    return min(budget, LLM_CHUNK_TOKENS) if LLM_CHUNK_TOKENS > 0 else budget
+
+# Отправляет запрос к API для анализа кода. Можно передать другую инструкцию и схему ответа
+# (например, для итогового отчета); ответ проверяется по схеме
+def send_request_to_api(prompt, instruction=None, schema=CODE_ANALYSIS_SCHEMA):
+    if instruction is None:
+        instruction = load_instruction()
     if instruction is None:
         print("Не удалось прочитать файл инструкции. Используем аварийную версию.")
-        instruction = """Пиши на русском.Проанализируй следующий код или данные и предоставь анализ в JSON формате."""
- 
-    # Проверяем, не является ли код файлом из папки .github
-    if "/github/" in prompt.lower() or "\\.github\\" in prompt.lower():
-        print("Пропуск анализа файла из папки .github")
-        return {"choices": [{"message": {"content": "{}"}}]}
+        instruction = FALLBACK_INSTRUCTION
 
-    # Ограничиваем размер промпта, чтобы избежать превышения токенов (приблизительно)
-    max_prompt_chars = 32000  # Примерное ограничение на символы для безопасности
-    if len(prompt) > max_prompt_chars:
-        print(f"Предупреждение: запрос слишком длинный ({len(prompt)} символов), сокращаем до {max_prompt_chars}")
-        prompt = prompt[:max_prompt_chars] + "\n...[контент обрезан из-за превышения максимальной длины]"
-
-    full_prompt = f"{instruction}\n\n```code\n{prompt}\n```"
+    cache_key = ANALYSIS_CACHE.key(MODEL, instruction, prompt)
+    cached = ANALYSIS_CACHE.get(cache_key)
+    if cached is not None:
+        print("Анализ взят из кэша")
+        return cached
+ 
+    # Ограничиваем размер промпта контекстом модели, оставляя место под инструкцию и ответ
+    max_prompt_tokens = __prompt_token_budget(instruction)
+    prompt_tokens = TOKEN_COUNTER.count(prompt)
+    if prompt_tokens > max_prompt_tokens:
+        print(f"Предупреждение: запрос слишком длинный (~{prompt_tokens} токенов), сокращаем до {max_prompt_tokens}")
+        prompt = TOKEN_COUNTER.truncate(prompt, max_prompt_tokens) + "\n...[контент обрезан из-за превышения максимальной длины]"
 
     payload = {
         "model": MODEL,
-        "messages": [
-            {"role": "user", "content": full_prompt}
-        ]
+        "messages": build_messages(instruction, prompt),
+        "max_tokens": LLM_MAX_OUTPUT_TOKENS
     }
+    if LLM_GUIDED_DECODING and schema is not None:
+        payload["response_format"] = {
+            "type": "json_schema",
+            "json_schema": {"name": "analysis", "schema": schema}
+        }
 
     # Используем повторные попытки при ошибках подключения
     retries = 0
@@ -83,11 +154,17 @@ def send_request_to_api(prompt):
         try:
             start_time = time.time()
             print(f"Отправка запроса к API ({retries+1}/{MAX_RETRIES})...")
-            response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload), timeout=120)
+            response = get_session(LLM_SESSION).post(
+                API_URL, headers=HEADERS, data=json.dumps(payload), timeout=default_timeout(LLM_READ_TIMEOUT)
+            )
             response.raise_for_status()
             end_time = time.time()
             print(f"Запрос выполнен за {end_time - start_time:.2f} секунд")
-            return response.json()
+            result = response.json()
+            # Кэшируем только ответы, из которых удалось извлечь анализ, соответствующий схеме
+            if parse_analysis(result["choices"][0]["message"]["content"], schema) is not None:
+                ANALYSIS_CACHE.put(cache_key, result)
+            return result
         except requests.exceptions.ConnectionError as e:
             retries += 1
             print(f"Ошибка подключения ({retries}/{MAX_RETRIES}): {e}")
@@ -103,15 +180,74 @@ def send_request_to_api(prompt):
             # Возвращаем пустой результат вместо None
             return {"choices": [{"message": {"content": "{}"}}]}
 
-def parse_analysis(content):
+# Асинхронная отправка запроса к API: одновременно выполняется не более LLM_MAX_IN_FLIGHT запросов
+async def send_request_to_api_async(prompt, instruction=None, schema=CODE_ANALYSIS_SCHEMA):
+    global _llm_executor, _llm_semaphore, _llm_semaphore_loop
+    loop = asyncio.get_running_loop()
+    if _llm_executor is None:
+        _llm_executor = ThreadPoolExecutor(max_workers=LLM_MAX_IN_FLIGHT, thread_name_prefix="llm")
+    if _llm_semaphore is None or _llm_semaphore_loop is not loop:
+        # Семафор привязан к event loop, в котором создан
+        _llm_semaphore = asyncio.Semaphore(LLM_MAX_IN_FLIGHT)
+        _llm_semaphore_loop = loop
+    async with _llm_semaphore:
+        return await loop.run_in_executor(_llm_executor, send_request_to_api, prompt, instruction, schema)
+
+# Измеряет время до первого токена ответа (стриминг, один токен)
+def __measure_ttft(messages):
+    payload = {"model": MODEL, "messages": messages, "max_tokens": 1, "stream": True}
+    start = time.perf_counter()
+    with get_session(LLM_SESSION).post(API_URL, headers=HEADERS, data=json.dumps(payload), stream=True,
+                                       timeout=default_timeout(LLM_READ_TIMEOUT)) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.startswith(b"data: ") and line != b"data: [DONE]":
+                break
+    return time.perf_counter() - start
+
+# Сравнивает время до первого токена с повторным использованием префикса инструкции и без него.
+# Без повторного использования инструкция предваряется уникальной меткой, чтобы префикс не совпадал
+def benchmark_ttft(code, runs=5):
+    instruction = load_instruction() or FALLBACK_INSTRUCTION
+    # Прогрев: префикс инструкции попадает в кэш vLLM
+    __measure_ttft(build_messages(instruction, code))
+
+    shared = []
+    unique = []
+    for run in range(runs):
+        # Код в каждом запросе свой, как у разных PR
+        run_code = f"{code}\n# run {run} {uuid.uuid4().hex}"
+        shared.append(__measure_ttft(build_messages(instruction, run_code)))
+        unique.append(__measure_ttft(build_messages(f"[{uuid.uuid4().hex}]\n{instruction}", run_code)))
+
+    result = {
+        "runs": runs,
+        "with_prefix_reuse": {"median": statistics.median(shared), "mean": statistics.mean(shared)},
+        "without_prefix_reuse": {"median": statistics.median(unique), "mean": statistics.mean(unique)}
+    }
+    print(f"TTFT с повторным использованием префикса: медиана {result['with_prefix_reuse']['median'] * 1000:.0f} мс")
+    print(f"TTFT без повторного использования префикса: медиана {result['without_prefix_reuse']['median'] * 1000:.0f} мс")
+    return result
+
+# Извлекает JSON из ответа модели и, если передана схема, проверяет его по ней
+def parse_analysis(content, schema=None):
     try:
-        # Находим JSON в тексте ответа
-        json_start = content.find('{')
-        json_end = content.rfind('}') + 1
-        if json_start >= 0 and json_end > json_start:
-            json_str = content[json_start:json_end]
-            return json.loads(json_str)
-        return None
+        try:
+            # При генерации по схеме ответ - чистый JSON
+            analysis = json.loads(content)
+        except json.JSONDecodeError:
+            # Находим JSON в тексте ответа
+            json_start = content.find('{')
+            json_end = content.rfind('}') + 1
+            if json_start < 0 or json_end <= json_start:
+                return None
+            analysis = json.loads(content[json_start:json_end])
+        if schema is not None:
+            errors = validate(analysis, schema)
+            if errors:
+                print(f"Ответ модели не соответствует схеме: {'; '.join(errors[:5])}")
+                return None
+        return analysis
     except json.JSONDecodeError as e:
         print(f"Ошибка парсинга JSON: {e}")
         return None
@@ -160,8 +296,15 @@ def main():
    
     parser = argparse.ArgumentParser(description="Анализ кода с помощью AI")
     parser.add_argument("--file", "-f", help="Путь к файлу с кодом для анализа")
+    parser.add_argument("--benchmark-ttft", type=int, metavar="RUNS",
+                        help="Измерить время до первого токена с повторным использованием префикса инструкции и без него")
     args = parser.parse_args()
 
+    if args.benchmark_ttft:
+        code = __read_input_file(args.file) if args.file else None
+        benchmark_ttft(code or "def example(value):\n    return value * 2", runs=args.benchmark_ttft)
+        return
+
     input_file = args.file if args.file else __select_input_file()
     if not input_file:
         print("Файл не выбран. Программа завершается.")